@@ -0,0 +1,57 @@
+# Measures how fast addNotes imports notes, against a running instance of Anki
+# with AnkiConnect loaded. The notes are added to a deck of their own, which
+# is deleted with all its cards afterwards unless --keep is given:
+#   $ python benchmarks/add_notes.py --counts 10000 100000
+
+import argparse
+import uuid
+
+from common import Client, add_client_arguments, print_throughput, timed
+
+
+def make_notes(deck, prefix, count):
+    return [{
+        'deckName': deck,
+        'modelName': 'Basic',
+        'fields': {'Front': f'{prefix} {index}', 'Back': f'back {index}'},
+        'tags': ['ankiconnect-benchmark'],
+    } for index in range(count)]
+
+
+def add_notes(client, notes, batch_size):
+    added = 0
+    for start in range(0, len(notes), batch_size):
+        results = client.send_request('addNotes', notes=notes[start : start + batch_size])
+        added += sum(result is not None for result in results)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='most notes sent in a single addNotes request')
+    parser.add_argument('--deck', default='AnkiConnect Benchmark')
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    client.send_request('createDeck', deck=args.deck)
+
+    try:
+        for count in args.counts:
+            notes = make_notes(args.deck, uuid.uuid4().hex, count)
+            added, seconds = timed(add_notes, client, notes, args.batch_size)
+            print_throughput(f'addNotes {count}', added, seconds, unit='notes')
+
+            # the same notes again, all of them duplicates
+            added, seconds = timed(add_notes, client, notes, args.batch_size)
+            print_throughput(f'addNotes {count} duplicates', count - added, seconds, unit='notes')
+    finally:
+        if not args.keep:
+            client.send_request('deleteDecks', decks=[args.deck], cardsToo=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Measures how long reading and writing ease factors and suspending cards take
+# for 1k, 10k and 100k cards, against a running instance of Anki with
+# AnkiConnect loaded. The notes are added to a deck of their own first, which
+# is deleted with all its cards afterwards unless --keep is given:
+#   $ python benchmarks/card_attributes.py --counts 1000 10000 100000
+
+import argparse
+import uuid
+
+from add_notes import add_notes, make_notes
+from common import Client, add_client_arguments, print_throughput, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--deck', default='AnkiConnect Benchmark')
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    client.send_request('createDeck', deck=args.deck)
+
+    try:
+        notes = make_notes(args.deck, uuid.uuid4().hex, max(args.counts))
+        add_notes(client, notes, 10000)
+        card_ids = client.send_request('findCards', query=f'"deck:{args.deck}"')
+
+        for count in args.counts:
+            ids = card_ids[:count]
+            _, seconds = timed(client.send_request, 'getEaseFactors', cards=ids)
+            print_throughput(f'getEaseFactors {len(ids)}', len(ids), seconds, unit='cards')
+            _, seconds = timed(client.send_request, 'setEaseFactors', cards=ids, easeFactors=[2300] * len(ids))
+            print_throughput(f'setEaseFactors {len(ids)}', len(ids), seconds, unit='cards')
+            _, seconds = timed(client.send_request, 'areSuspended', cards=ids)
+            print_throughput(f'areSuspended {len(ids)}', len(ids), seconds, unit='cards')
+            _, seconds = timed(client.send_request, 'suspend', cards=ids)
+            print_throughput(f'suspend {len(ids)}', len(ids), seconds, unit='cards')
+            client.send_request('unsuspend', cards=ids)
+    finally:
+        if not args.keep:
+            client.send_request('deleteDecks', decks=[args.deck], cardsToo=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# Measures how long cardsModTime and getDecks take for growing numbers of
+# cards, up to 500k by default, against a running instance of Anki with
+# AnkiConnect loaded. Both should scale linearly with the number of cards.
+# The notes are added to a deck of their own first, which is deleted with all
+# its cards afterwards unless --keep is given:
+#   $ python benchmarks/cards_mod_time.py --counts 10000 100000 500000
+
+import argparse
+import uuid
+
+from add_notes import add_notes, make_notes
+from common import Client, add_client_arguments, print_throughput, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10000, 50000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--deck', default='AnkiConnect Benchmark')
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    client.send_request('createDeck', deck=args.deck)
+
+    try:
+        notes = make_notes(args.deck, uuid.uuid4().hex, max(args.counts))
+        add_notes(client, notes, 10000)
+        card_ids = client.send_request('findCards', query=f'"deck:{args.deck}"')
+
+        for count in args.counts:
+            ids = card_ids[:count]
+            for action in ['cardsModTime', 'getDecks']:
+                best = min(timed(client.send_request, action, cards=ids)[1] for _ in range(args.repeat))
+                print_throughput(f'{action} {len(ids)}', len(ids), best, unit='cards')
+    finally:
+        if not args.keep:
+            client.send_request('deleteDecks', decks=[args.deck], cardsToo=True)
+
+
+if __name__ == '__main__':
+    main()
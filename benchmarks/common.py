@@ -0,0 +1,66 @@
+# Helpers shared by the benchmarks in this directory.
+#
+# The benchmarks talk to a running instance of Anki with AnkiConnect loaded,
+# so use a throwaway profile: some of them create decks, notes and reviews.
+
+import json
+import statistics
+import time
+import urllib.request
+from dataclasses import dataclass
+
+
+@dataclass
+class Client:
+    port: int
+    host: str = 'localhost'
+
+    @staticmethod
+    def from_arguments(args):
+        return Client(port=args.port, host=args.host)
+
+    @staticmethod
+    def make_request(action, **params):
+        return {'action': action, 'params': params, 'version': 6}
+
+    def send_request(self, action, **params):
+        request_data = self.make_request(action, **params)
+        json_bytes = json.dumps(request_data).encode('utf-8')
+        response = json.loads(self.send_bytes(json_bytes))
+        if response['error'] is not None:
+            raise Exception(response['error'])
+        return response['result']
+
+    def send_bytes(self, bytes):  # noqa
+        request_url = f'http://{self.host}:{self.port}'
+        request = urllib.request.Request(request_url, bytes)
+        return urllib.request.urlopen(request).read()
+
+
+def add_client_arguments(parser):
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_latencies(name, seconds):
+    print(f'{name}: {len(seconds)} samples, '
+          f'p50 {percentile(seconds, 0.50) * 1000:.2f} ms, '
+          f'p99 {percentile(seconds, 0.99) * 1000:.2f} ms, '
+          f'mean {statistics.mean(seconds) * 1000:.2f} ms')
+
+
+def print_throughput(name, count, seconds, unit='items'):
+    print(f'{name}: {count} {unit} in {seconds:.3f} s '
+          f'({count / seconds if seconds else float("inf"):.0f} {unit}/s)')
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
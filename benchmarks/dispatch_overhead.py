@@ -0,0 +1,41 @@
+# Measures how much time AnkiConnect spends finding the method behind an
+# action, against a running instance of Anki with AnkiConnect loaded.
+#
+# Single `version` requests are dominated by the HTTP round trip, so the
+# per-action cost is also measured inside one `multi` request carrying many
+# `version` actions, which is dispatched once per sub-action:
+#   $ python benchmarks/dispatch_overhead.py --requests 1000 --multi-size 10000
+
+import argparse
+import time
+
+from common import Client, add_client_arguments, print_latencies, print_throughput, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--multi-size', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    client.send_request('version')
+
+    latencies = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client.send_request('version')
+        latencies.append(time.perf_counter() - start)
+
+    print_latencies('version', latencies)
+
+    actions = [Client.make_request('version')] * args.multi_size
+    best = min(timed(client.send_request, 'multi', actions=actions)[1] for _ in range(args.repeat))
+    print_throughput('multi of version', args.multi_size, best, unit='actions')
+    print(f'{best / args.multi_size * 1e6:.2f} us per action')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# Measures how long notesInfo takes for 1k, 10k and 100k notes, against a
+# running instance of Anki with AnkiConnect loaded. The notes are added to a
+# deck of their own first, which is deleted with all its cards afterwards
+# unless --keep is given:
+#   $ python benchmarks/notes_info.py --counts 1000 10000 100000
+
+import argparse
+import uuid
+
+from add_notes import add_notes, make_notes
+from common import Client, add_client_arguments, print_throughput, timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--deck', default='AnkiConnect Benchmark')
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    client.send_request('createDeck', deck=args.deck)
+
+    try:
+        notes = make_notes(args.deck, uuid.uuid4().hex, max(args.counts))
+        add_notes(client, notes, 10000)
+        note_ids = client.send_request('findNotes', query=f'"deck:{args.deck}"')
+
+        for count in args.counts:
+            ids = note_ids[:count]
+            best = min(timed(client.send_request, 'notesInfo', notes=ids)[1] for _ in range(args.repeat))
+            print_throughput(f'notesInfo {len(ids)}', len(ids), best, unit='notes')
+    finally:
+        if not args.keep:
+            client.send_request('deleteDecks', decks=[args.deck], cardsToo=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Measures how fast requests with bodies of various sizes are parsed as their
+# bytes arrive, both with the incremental WebRequestParser and with the former
+# approach of appending every 1 KiB chunk to a buffer and re-parsing all of it.
+# Does not need a running instance of Anki, only an environment where the
+# add-on can be imported:
+#   $ python benchmarks/request_parser.py --sizes 1024 1048576 52428800
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from plugin.web import WebRequestParser  # noqa
+
+from common import print_throughput, timed  # noqa
+
+
+class ChunkedSocket:
+    # hands out a prepared request the way a socket would,
+    # never more than `maxChunk` bytes at a time
+    def __init__(self, data, maxChunk):
+        self.data = memoryview(data)
+        self.offset = 0
+        self.maxChunk = maxChunk
+
+    def recv(self, size):
+        size = min(size, self.maxChunk)
+        chunk = self.data[self.offset : self.offset + size].tobytes()
+        self.offset += len(chunk)
+        return chunk
+
+    def recv_into(self, buffer, size):
+        size = min(size, self.maxChunk, len(buffer))
+        chunk = self.data[self.offset : self.offset + size]
+        buffer[:len(chunk)] = chunk
+        self.offset += len(chunk)
+        return len(chunk)
+
+
+def make_request(bodySize):
+    body = b'x' * bodySize
+    header = 'POST / HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(len(body))
+    return header.encode('utf-8') + body
+
+
+def parse_incrementally(data, maxChunk):
+    sock = ChunkedSocket(data, maxChunk)
+    parser = WebRequestParser(len(data))
+    while True:
+        parser.recvFrom(sock)
+        request = parser.nextRequest()
+        if request is not None:
+            return request
+
+
+def parse_legacy(data, recvSize=1024):
+    # the parser as it was before WebRequestParser
+    def parseRequest(data):
+        parts = data.split(b'\r\n\r\n', 1)
+        if len(parts) == 1:
+            return None, 0
+
+        lines = parts[0].split(b'\r\n')
+        headers = {}
+        for line in lines[1:]:
+            pair = line.split(b': ')
+            headers[pair[0].lower()] = pair[1] if len(pair) > 1 else None
+
+        headerLength = len(parts[0]) + 4
+        totalLength = headerLength + int(headers.get(b'content-length', 0))
+        if totalLength > len(data):
+            return None, 0
+
+        return data[headerLength : totalLength], totalLength
+
+    sock = ChunkedSocket(data, recvSize)
+    readBuff = bytes()
+    while True:
+        readBuff += sock.recv(recvSize)
+        body, length = parseRequest(readBuff)
+        if body is not None:
+            return body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1024, 64 * 1024, 1024 * 1024, 20 * 1024 * 1024, 50 * 1024 * 1024])
+    parser.add_argument('--max-chunk', type=int, default=64 * 1024,
+                        help='most bytes a single recv call returns')
+    parser.add_argument('--legacy-max-size', type=int, default=4 * 1024 * 1024,
+                        help='the legacy parser is quadratic, skip it above this size')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        data = make_request(size)
+        megabytes = len(data) / (1024 * 1024)
+
+        best = min(timed(parse_incrementally, data, args.max_chunk)[1] for _ in range(args.repeat))
+        print_throughput('incremental {} B'.format(size), round(megabytes, 3), best, unit='MiB')
+
+        if size <= args.legacy_max_size:
+            best = min(timed(parse_legacy, data)[1] for _ in range(args.repeat))
+            print_throughput('legacy      {} B'.format(size), round(megabytes, 3), best, unit='MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# Measures the round trip latency of the `version` action against a running
+# instance of Anki with AnkiConnect loaded.
+#
+# To compare the polling and the event driven server, run it once with
+# `"apiEventDriven": false` and once with `"apiEventDriven": true` in the
+# add-on config, restarting Anki in between:
+#   $ python benchmarks/version_latency.py --requests 2000
+
+import argparse
+import time
+
+from common import Client, add_client_arguments, print_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    args = parser.parse_args()
+
+    client = Client.from_arguments(args)
+    for _ in range(args.warmup):
+        client.send_request('version')
+
+    latencies = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client.send_request('version')
+        latencies.append(time.perf_counter() - start)
+
+    print_latencies('version', latencies)
+
+
+if __name__ == '__main__':
+    main()
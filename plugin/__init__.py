@@ -21,9 +21,12 @@ if anki_version < (2, 1, 45):
     raise Exception("Minimum Anki version supported: 2.1.45")
 
 import base64
+import collections
+import concurrent.futures
 import glob
 import hashlib
 import inspect
+import itertools
 import json
 import os
 import os.path
@@ -41,11 +44,15 @@ from anki.exporting import AnkiPackageExporter
 from anki.importing import AnkiPackageImporter
 from anki.notes import Note
 from anki.errors import NotFoundError
+from aqt import gui_hooks
+from aqt.reviewer import Reviewer
 from aqt.qt import Qt, QTimer, QMessageBox, QCheckBox
 
 from .web import format_exception_reply, format_success_reply
 from .edit import Edit
-from . import web, util
+from .batch import WRITABLE_CARD_COLUMNS, CardBatch, NoteBatch, fieldChecksum
+from .cache import RenderCache, ResultSetCache, ReviewCounts, modelKey, noteKey
+from . import jobs, web, util
 
 
 #
@@ -56,7 +63,25 @@ class AnkiConnect:
     def __init__(self):
         self.log = None
         self.timer = None
+        self.transaction = False
+        self.jobs = jobs.JobQueue()
+        self.renderCache = RenderCache()
+        self.resultSets = ResultSetCache()
+        gui_hooks.operation_did_execute.append(self.resultSets.invalidate)
+        gui_hooks.state_did_undo.append(self.resultSets.invalidate)
+        self.reviewCounts = ReviewCounts()
+        # reviews with ids older than the newest one counted can come from
+        # syncing, importing, undoing or rolling back, and are only found by
+        # counting again
+        gui_hooks.collection_did_load.append(self.reviewCounts.invalidate)
+        gui_hooks.operation_did_execute.append(self.onOperationDidExecute)
+        gui_hooks.state_did_undo.append(self.reviewCounts.invalidate)
+        gui_hooks.sync_did_finish.append(self.reviewCounts.invalidate)
+        self.methodsClass = None
+        self.methods = {}
+        self.actions = {}
         self.server = web.WebServer(self.handler)
+        self.apiMethods()
 
     def initLogging(self):
         logPath = util.setting('apiLogPath')
@@ -67,10 +92,19 @@ class AnkiConnect:
         try:
             self.server.listen()
 
-            # only keep reference to prevent garbage collection
-            self.timer = QTimer()
-            self.timer.timeout.connect(self.advance)
-            self.timer.start(util.setting('apiPollInterval'))
+            if util.setting('apiIoThread'):
+                # sockets, parsing and encoding are all handled on the server's own thread,
+                # only the actions themselves are dispatched to the main thread
+                self.server.handler = web.WebDispatcher(self.handler)
+                self.server.start()
+            elif util.setting('apiEventDriven'):
+                # wake up only when one of the server sockets is ready
+                self.server.setNotifier(web.WebNotifier(self.advance))
+            else:
+                # only keep reference to prevent garbage collection
+                self.timer = QTimer()
+                self.timer.timeout.connect(self.advance)
+                self.timer.start(util.setting('apiPollInterval'))
         except:
             QMessageBox.critical(
                 self.window(),
@@ -96,45 +130,122 @@ class AnkiConnect:
     def handler(self, request):
         self.logEvent('request', request)
 
+        version = request.get('version', 4)
+
+        try:
+            reply = format_success_reply(version, self.dispatch(request))
+        except Exception as e:
+            reply = format_exception_reply(version, e)
+
+        self.logEvent('reply', reply)
+        return reply
+
+
+    def dispatch(self, request):
         name = request.get('action', '')
         version = request.get('version', 4)
         params = request.get('params', {})
         key = request.get('key')
 
-        try:
-            if key != util.setting('apiKey') and name != 'requestPermission':
-                raise Exception('valid api key must be provided')
+        if key != util.setting('apiKey') and name != 'requestPermission':
+            raise Exception('valid api key must be provided')
+
+        method = self.apiActions(version).get(name)
+        if method is None:
+            raise Exception('unsupported action')
+
+        if request.get('async', False):
+            return self.jobs.submit(name, self.jobSteps(method, params))
+
+        return method(**params)
+
+
+    def jobSteps(self, method, params):
+        # plain multi runs one action per step, and actions over long lists
+        # run on a chunk of the list per step. some actions have steps of their
+        # own, and everything else is a single step
+        methodName = method.__name__
+        steps = {
+            'clearUnusedTags': self.clearUnusedTagsSteps,
+            'exportPackage': self.exportPackageSteps,
+            'importPackage': self.importPackageSteps,
+            'insertReviews': self.insertReviewsSteps,
+            'replaceTags': self.replaceTagsSteps,
+            'sync': self.syncSteps,
+        }.get(methodName)
+        chunkedParam = {
+            'addNotes': 'notes',
+            'canAddNotes': 'notes',
+            'cardsInfo': 'cards',
+            'notesInfo': 'notes',
+        }.get(methodName)
+
+        if methodName == 'multi' and not params.get('transaction') and not params.get('atomic'):
+            return self.actionSteps(params['actions'])
+        if steps is not None:
+            return steps(**params)
+        if methodName == 'replaceTagsInAllNotes':
+            return self.replaceTagsSteps(self.database().list('select id from notes'), **params)
+        if chunkedParam is not None and isinstance(params.get(chunkedParam), list) and not params.get('normalized'):
+            return jobs.chunkedSteps(method, params, chunkedParam, util.setting('jobChunkSize'))
+
+        return jobs.singleStep(method, params)
+
+
+    def apiMethods(self):
+        # bound api methods by method name, collected once per class
+        cls = type(self)
+        if self.methodsClass is not cls:
+            self.methods = {}
+            self.actions = {}
+            self.maxApiVersion = 0
+
+            for methodName, methodFunc in inspect.getmembers(cls, predicate=inspect.isfunction):
+                if getattr(methodFunc, 'api', False):
+                    self.methods[methodName] = getattr(self, methodName)
+                    for apiVersion, apiName in getattr(methodFunc, 'versions', []):
+                        self.maxApiVersion = max(self.maxApiVersion, apiVersion)
+
+            self.methodsClass = cls
+
+        return self.methods
+
 
-            method = None
+    def apiActions(self, version):
+        # bound api methods by action name, as of the given api version.
+        # all versions past the last one any action was renamed in share a table
+        methods = self.apiMethods()
+        if isinstance(version, int):
+            version = max(0, min(version, self.maxApiVersion + 1))
 
-            for methodName, methodInst in inspect.getmembers(self, predicate=inspect.ismethod):
+        actions = self.actions.get(version)
+        if actions is None:
+            actions = {}
+            for methodName, methodInst in methods.items():
                 apiVersionLast = 0
                 apiNameLast = None
 
-                if getattr(methodInst, 'api', False):
-                    for apiVersion, apiName in getattr(methodInst, 'versions', []):
-                        if apiVersionLast < apiVersion <= version:
-                            apiVersionLast = apiVersion
-                            apiNameLast = apiName
+                for apiVersion, apiName in getattr(methodInst, 'versions', []):
+                    if apiVersionLast < apiVersion <= version:
+                        apiVersionLast = apiVersion
+                        apiNameLast = apiName
 
-                    if apiNameLast is None and apiVersionLast == 0:
-                        apiNameLast = methodName
+                if apiNameLast is None and apiVersionLast == 0:
+                    apiNameLast = methodName
 
-                    if apiNameLast is not None and apiNameLast == name:
-                        method = methodInst
-                        break
+                if apiNameLast is not None:
+                    actions.setdefault(apiNameLast, methodInst)
 
-            if method is None:
-                raise Exception('unsupported action')
+            self.actions[version] = actions
 
-            api_return_value = methodInst(**params)
-            reply = format_success_reply(version, api_return_value)
+        return actions
 
-        except Exception as e:
-            reply = format_exception_reply(version, e)
 
-        self.logEvent('reply', reply)
-        return reply
+    def onOperationDidExecute(self, changes, handler):
+        # cards answered in the reviewer add the newest reviews, which are
+        # counted incrementally, so only other operations start counting over
+        if not isinstance(handler, Reviewer):
+            self.reviewCounts.invalidate()
 
 
     def window(self):
@@ -211,22 +322,157 @@ class AnkiConnect:
 
 
     def startEditing(self):
-        self.window().requireReset()
+        # inside a transaction the main window is reset once, when it ends
+        if not self.transaction:
+            self.window().requireReset()
 
 
     def stopEditing(self):
-        if self.collection() is not None:
+        if not self.transaction and self.collection() is not None:
             self.window().maybeReset()
 
 
-    def createNote(self, note):
+    def autosave(self):
+        # inside a transaction changes are committed once, when it ends
+        if not self.transaction:
+            self.collection().autosave()
+
+
+    def runTransaction(self, actions, atomic):
         collection = self.collection()
+        collection.save()
+        self.window().requireReset()
+        undoStep = collection.add_custom_undo_entry('AnkiConnect')
+        self.transaction = True
+
+        try:
+            replies = self.runActions(actions, atomic)
+        except:
+            collection.rollback()
+            # the undo entries of the rolled back operations would undo changes
+            # that were never made. the backend has no way of dropping only
+            # those, but clears its whole undo queue whenever sql is executed
+            collection.db.execute('update col set mod = mod')
+            collection.clear_python_undo()
+            self.reviewCounts.invalidate()
+            raise
+        else:
+            try:
+                collection.merge_undo_entries(undoStep)
+            except Exception:
+                pass  # an action that cannot be undone cleared the undo queue
+            collection.save()
+        finally:
+            self.transaction = False
+            self.window().maybeReset()
+
+        return replies
+
 
-        model = collection.models.byName(note['modelName'])
+    def runActions(self, actions, atomic=False):
+        return jobs.runSteps(self.actionSteps(actions, atomic))
+
+
+    def actionSteps(self, actions, atomic=False):
+        # results of the actions that ran so far, for references to them
+        results = []
+        failed = set()
+        replies = []
+
+        for index, action in enumerate(actions):
+            yield index, len(actions)
+            self.logEvent('request', action)
+            version = action.get('version', 4)
+
+            try:
+                request = self.resolveReferences(action, results, failed)
+                result = self.dispatch(request)
+                reply = format_success_reply(version, result)
+            except Exception as e:
+                if atomic:
+                    raise Exception('action {} failed: {}'.format(index, e))
+                result = None
+                failed.add(index)
+                reply = format_exception_reply(version, e)
+
+            self.logEvent('reply', reply)
+            results.append(result)
+            replies.append(reply if action.get('return', True) else None)
+
+        return replies
+
+
+    def resolveReferences(self, value, results, failed):
+        # replaces references such as {"$result": 0, "key": "cards", "flatten": true}
+        # with the result of an earlier action; unchanged values are not copied
+        if isinstance(value, dict):
+            if isinstance(value.get('$result'), int) and value.keys() <= {'$result', 'key', 'flatten'}:
+                return self.resolveReference(value, results, failed)
+
+            resolved = None
+            for key, item in value.items():
+                resolvedItem = self.resolveReferences(item, results, failed)
+                if resolvedItem is not item:
+                    if resolved is None:
+                        resolved = dict(value)
+                    resolved[key] = resolvedItem
+
+            return value if resolved is None else resolved
+
+        if isinstance(value, list):
+            resolved = None
+            for index, item in enumerate(value):
+                resolvedItem = self.resolveReferences(item, results, failed)
+                if resolvedItem is not item:
+                    if resolved is None:
+                        resolved = list(value)
+                    resolved[index] = resolvedItem
+
+            return value if resolved is None else resolved
+
+        return value
+
+
+    def resolveReference(self, reference, results, failed):
+        index = reference['$result']
+        if not 0 <= index < len(results):
+            raise Exception('reference to action {} which has not run yet'.format(index))
+        if index in failed:
+            raise Exception('reference to action {} which failed'.format(index))
+
+        result = results[index]
+
+        key = reference.get('key')
+        if key is not None:
+            try:
+                if isinstance(result, list):
+                    result = [item[key] for item in result]
+                else:
+                    result = result[key]
+            except (KeyError, IndexError, TypeError):
+                raise Exception('result of action {} has no {}'.format(index, key))
+
+        if reference.get('flatten', False):
+            if not isinstance(result, list) or not all(isinstance(item, list) for item in result):
+                raise Exception('result of action {} is not a list of lists'.format(index))
+            result = [item for items in result for item in items]
+        elif isinstance(result, list):
+            # actions may modify the lists they are given
+            result = list(result)
+
+        return result
+
+
+    def createNote(self, note, batch=None):
+        collection = self.collection()
+        if batch is None:
+            batch = NoteBatch(collection)
+
+        model = batch.model(note['modelName'])
         if model is None:
             raise Exception('model was not found: {}'.format(note['modelName']))
 
-        deck = collection.decks.byName(note['deckName'])
+        deck = batch.deck(note['deckName'])
         if deck is None:
             raise Exception('deck was not found: {}'.format(note['deckName']))
 
@@ -277,7 +523,9 @@ class AnkiConnect:
             duplicateScope,
             duplicateScopeDeckName,
             duplicateScopeCheckChildren,
-            duplicateScopeCheckAllModels
+            duplicateScopeCheckAllModels,
+            batch,
+            model
         )
 
         if duplicateOrEmpty == 1:
@@ -300,57 +548,47 @@ class AnkiConnect:
         duplicateScope,
         duplicateScopeDeckName,
         duplicateScopeCheckChildren,
-        duplicateScopeCheckAllModels
+        duplicateScopeCheckAllModels,
+        batch=None,
+        model=None
     ):
         # Returns: 1 if first is empty, 2 if first is a duplicate, 0 otherwise.
 
         # note.dupeOrEmpty returns if a note is a global duplicate with the specific model.
         # This is used as the default check, and the rest of this function is manually
         # checking if the note is a duplicate with additional options.
+        # The batch knows when neither check could find a duplicate.
+        if batch is None:
+            batch = NoteBatch(collection)
+
         if duplicateScope != 'deck' and not duplicateScopeCheckAllModels:
+            if model is not None and batch.isUnique(note, model):
+                return 0
             return note.dupeOrEmpty() or 0
 
         # Primary field for uniqueness
         val = note.fields[0]
         if not val.strip():
             return 1
-        csum = anki.utils.fieldChecksum(val)
+        csum = fieldChecksum(val)
 
-        # Create dictionary of deck ids
+        # Set of deck ids
         dids = None
         if duplicateScope == 'deck':
             did = deck['id']
             if duplicateScopeDeckName is not None:
-                deck2 = collection.decks.byName(duplicateScopeDeckName)
+                deck2 = batch.deck(duplicateScopeDeckName)
                 if deck2 is None:
                     # Invalid deck, so cannot be duplicate
                     return 0
                 did = deck2['id']
 
-            dids = {did: True}
-            if duplicateScopeCheckChildren:
-                for kv in collection.decks.children(did):
-                    dids[kv[1]] = True
-
-        # Build query
-        query = 'select id from notes where csum=?'
-        queryArgs = [csum]
-        if note.id:
-            query += ' and id!=?'
-            queryArgs.append(note.id)
-        if not duplicateScopeCheckAllModels:
-            query += ' and mid=?'
-            queryArgs.append(note.mid)
-
-        # Search
-        for noteId in note.col.db.list(query, *queryArgs):
-            if dids is None:
-                # Duplicate note exists in the collection
-                return 2
-            # Validate that a card exists in one of the specified decks
-            for cardDeckId in note.col.db.list('select did from cards where nid=?', noteId):
-                if cardDeckId in dids:
-                    return 2
+            dids = batch.scope(did, duplicateScopeCheckChildren)
+
+        # Search notes with the same checksum, and the decks of their cards
+        mid = None if duplicateScopeCheckAllModels else note.mid
+        if batch.contains(csum, mid, dids, note.id or None):
+            return 2
 
         # Not a duplicate
         return 0
@@ -489,19 +727,95 @@ class AnkiConnect:
         self.window().onSync()
 
 
+    def syncSteps(self):
+        # as a job, sync is done once Anki has finished syncing. it does not
+        # start to sync without a login, and then the job is done right away
+        started = []
+        finished = concurrent.futures.Future()
+
+        def onStart():
+            started.append(True)
+
+        def onFinish():
+            if not finished.done():
+                finished.set_result(None)
+
+        gui_hooks.sync_will_start.append(onStart)
+        gui_hooks.sync_did_finish.append(onFinish)
+        try:
+            yield 0, 1
+            self.window().onSync()
+            if started:
+                yield finished
+        finally:
+            gui_hooks.sync_will_start.remove(onStart)
+            gui_hooks.sync_did_finish.remove(onFinish)
+
+
+    @util.api()
+    def multi(self, actions, transaction=False, atomic=False):
+        # with transaction, the actions are committed once and undone as a single
+        # step. with atomic, the first failing action also rolls back all of them,
+        # which clears the whole undo history of the collection, not only theirs
+        if (transaction or atomic) and not self.transaction:
+            return self.runTransaction(actions, atomic)
+
+        return self.runActions(actions, atomic)
+
+
+    @util.api()
+    def getCacheStats(self):
+        return {
+            'render': self.renderCache.stats(),
+            'resultSets': self.resultSets.stats(),
+            'reviewCounts': self.reviewCounts.stats(),
+        }
+
+
     @util.api()
-    def multi(self, actions):
-        return list(map(self.handler, actions))
+    def jobStatus(self, job):
+        return self.jobs.get(job).status()
 
 
     @util.api()
-    def getNumCardsReviewedToday(self):
-        return self.database().scalar('select count() from revlog where id > ?', (self.scheduler().dayCutoff - 86400) * 1000)
+    def jobCancel(self, job):
+        return self.jobs.cancel(job)
+
 
     @util.api()
-    def getNumCardsReviewedByDay(self):
-        return self.database().all('select date(id/1000 - ?, "unixepoch", "localtime") as day, count() from revlog group by day order by day desc',
-                                    int(time.strftime("%H", time.localtime(self.scheduler().dayCutoff))) * 3600)
+    def getNumCardsReviewedToday(self, deck=None):
+        # an indexed count is cheaper than building the counts by day
+        if deck is None and self.reviewCounts.key is None:
+            return self.database().scalar('select count() from revlog where id > ?', (self.scheduler().dayCutoff - 86400) * 1000)
+
+        days, offset = self.reviewCountsByDay(deck)
+        today = time.strftime('%Y-%m-%d', time.localtime(self.scheduler().dayCutoff - 86400 - offset))
+        return days.get(today, 0)
+
+    @util.api()
+    def getNumCardsReviewedByDay(self, startDate=None, endDate=None, deck=None):
+        # days are dates like 2021-12-31, and the range includes both of its ends
+        days, _ = self.reviewCountsByDay(deck)
+        return [
+            [day, count] for day, count in sorted(days.items(), reverse=True)
+            if (startDate is None or day >= startDate) and (endDate is None or day <= endDate)
+        ]
+
+
+    def reviewCountsByDay(self, deck):
+        # reviews are counted by day once, and only new ones are added later on.
+        # a deck includes its subdecks
+        offset = int(time.strftime("%H", time.localtime(self.scheduler().dayCutoff))) * 3600
+        self.reviewCounts.update(self.collection(), offset)
+
+        deckIds = None
+        if deck is not None:
+            did = self.decks().id(deck, create=False)
+            if did is None:
+                raise Exception('deck was not found: {}'.format(deck))
+            deckIds = {did} | {childId for _, childId in self.decks().children(did)}
+
+        return self.reviewCounts.byDay(deckIds), offset
 
 
     @util.api()
@@ -531,14 +845,16 @@ class AnkiConnect:
 
     @util.api()
     def getDecks(self, cards):
+        # Anki falls back to the default deck for missing cards and decks,
+        # so names are looked up once for each deck id, missing ones included
+        values = CardBatch(self.collection()).read(cards, ['did'])
+        names = {}
         decks = {}
         for card in cards:
-            did = self.database().scalar('select did from cards where id=?', card)
-            deck = self.decks().get(did)['name']
-            if deck in decks:
-                decks[deck].append(card)
-            else:
-                decks[deck] = [card]
+            did = values[card]['did'] if card in values else None
+            if did not in names:
+                names[did] = self.decks().get(did)['name']
+            decks.setdefault(names[did], []).append(card)
 
         return decks
 
@@ -740,7 +1056,7 @@ class AnkiConnect:
         nCardsAdded = collection.addNote(ankiNote)
         if nCardsAdded < 1:
             raise Exception('The field values you have provided would make an empty question on all cards.')
-        collection.autosave()
+        self.autosave()
         self.stopEditing()
 
         return ankiNote.id
@@ -820,7 +1136,7 @@ class AnkiConnect:
 
         ankiNote.flush()
 
-        self.collection().autosave()
+        self.autosave()
         self.stopEditing()
 
 
@@ -877,58 +1193,54 @@ class AnkiConnect:
         self.collection().tags.registerNotes()
 
 
+    def clearUnusedTagsSteps(self):
+        # as a job, the tags are cleared on a background thread
+        registerNotes = self.collection().tags.registerNotes
+        yield from jobs.backgroundSteps(self.window().taskman.with_progress, registerNotes)
+
+
     @util.api()
     def replaceTags(self, notes, tag_to_replace, replace_with_tag):
         self.window().progress.start()
-
-        for nid in notes:
-            try:
-                note = self.getNote(nid)
-            except NotFoundError:
-                continue
-
-            if note.hasTag(tag_to_replace):
-                note.delTag(tag_to_replace)
-                note.addTag(replace_with_tag)
-                note.flush()
-
-        self.window().requireReset()
+        jobs.runSteps(self.replaceTagsSteps(notes, tag_to_replace, replace_with_tag))
         self.window().progress.finish()
-        self.window().reset()
 
 
     @util.api()
     def replaceTagsInAllNotes(self, tag_to_replace, replace_with_tag):
         self.window().progress.start()
+        notes = self.database().list('select id from notes')
+        jobs.runSteps(self.replaceTagsSteps(notes, tag_to_replace, replace_with_tag))
+        self.window().progress.finish()
 
-        collection = self.collection()
-        for nid in collection.db.list('select id from notes'):
-            note = self.getNote(nid)
-            if note.hasTag(tag_to_replace):
-                note.delTag(tag_to_replace)
-                note.addTag(replace_with_tag)
-                note.flush()
 
-        self.window().requireReset()
-        self.window().progress.finish()
-        self.window().reset()
+    def replaceTagsSteps(self, notes, tag_to_replace, replace_with_tag):
+        # replaces the tag in a chunk of notes per step
+        notes = list(notes)
+        chunkSize = util.setting('jobChunkSize')
 
+        self.startEditing()
+        try:
+            for start in range(0, len(notes), chunkSize):
+                yield start, len(notes)
+                for nid in notes[start : start + chunkSize]:
+                    try:
+                        note = self.getNote(nid)
+                    except NotFoundError:
+                        continue
 
-    @util.api()
-    def setEaseFactors(self, cards, easeFactors):
-        couldSetEaseFactors = []
-        for i, card in enumerate(cards):
-            try:
-                ankiCard = self.getCard(card)
-            except NotFoundError:
-                couldSetEaseFactors.append(False)
-                continue
+                    if note.hasTag(tag_to_replace):
+                        note.delTag(tag_to_replace)
+                        note.addTag(replace_with_tag)
+                        note.flush()
+        finally:
+            self.stopEditing()
 
-            couldSetEaseFactors.append(True)
-            ankiCard.factor = easeFactors[i]
-            ankiCard.flush()
 
-        return couldSetEaseFactors
+    @util.api()
+    def setEaseFactors(self, cards, easeFactors):
+        updates = [{'factor': easeFactors[i]} for i in range(len(cards))]
+        return CardBatch(self.collection()).write(cards, updates)
 
     @util.api()
     def setSpecificValueOfCard(self, card, keys,
@@ -953,10 +1265,18 @@ class AnkiConnect:
 
         result = []
         try:
-            ankiCard = self.getCard(card)
-            for i, key in enumerate(keys):
-                setattr(ankiCard, key, newValues[i])
-            ankiCard.flush()
+            if 'mod' in keys or 'usn' in keys:
+                raise Exception('mod and usn are set by Anki when a card is saved')
+
+            if set(keys) <= set(WRITABLE_CARD_COLUMNS):
+                if not CardBatch(self.collection()).write([card], [dict(zip(keys, newValues))])[0]:
+                    self.raiseNotFoundError('Card was not found: {}'.format(card))
+            else:
+                # other attributes, such as the card data, are left to Anki
+                ankiCard = self.getCard(card)
+                for key, value in zip(keys, newValues):
+                    setattr(ankiCard, key, value)
+                ankiCard.flush()
             result.append(True)
         except Exception as e:
             result.append([False, str(e)])
@@ -965,25 +1285,19 @@ class AnkiConnect:
 
     @util.api()
     def getEaseFactors(self, cards):
-        easeFactors = []
-        for card in cards:
-            try:
-                ankiCard = self.getCard(card)
-            except NotFoundError:
-                easeFactors.append(None)
-                continue
-
-            easeFactors.append(ankiCard.factor)
-
-        return easeFactors
+        values = CardBatch(self.collection()).read(cards, ['factor'])
+        return [values[card]['factor'] if card in values else None for card in cards]
 
 
     @util.api()
     def suspend(self, cards, suspend=True):
-        for card in cards:
-            if self.suspended(card) == suspend:
-                cards.remove(card)
+        # only cards that are not suspended or unsuspended already are changed
+        suspended = self.areSuspended(cards)
+        for card, cardSuspended in zip(cards, suspended):
+            if cardSuspended is None:
+                self.raiseNotFoundError('Card was not found: {}'.format(card))
 
+        cards = [card for card, cardSuspended in zip(cards, suspended) if cardSuspended != suspend]
         if len(cards) == 0:
             return False
 
@@ -1005,32 +1319,39 @@ class AnkiConnect:
 
     @util.api()
     def suspended(self, card):
-        card = self.getCard(card)
-        return card.queue == -1
+        suspended = self.areSuspended([card])[0]
+        if suspended is None:
+            self.raiseNotFoundError('Card was not found: {}'.format(card))
+
+        return suspended
 
 
     @util.api()
     def areSuspended(self, cards):
-        suspended = []
-        for card in cards:
-            try:
-                suspended.append(self.suspended(card))
-            except NotFoundError:
-                suspended.append(None)
-
-        return suspended
+        values = CardBatch(self.collection()).read(cards, ['queue'])
+        return [values[card]['queue'] == -1 if card in values else None for card in cards]
 
 
     @util.api()
     def areDue(self, cards):
+        # cards whose latest review set an interval in days, or a learning step
+        # of at most 20 minutes, are due as Anki's search has it. cards with a
+        # longer learning step, in negative seconds, are due once it has passed
+        new = self.findCardsAmong(cards, 'is:new')
+        latest = self.latestReviews(cards)
+        searchDue = [card for card in cards if card not in new and card in latest and latest[card][1] >= -1200]
+        dueBySearch = self.findCardsAmong(searchDue, 'is:due')
+
         due = []
         for card in cards:
-            if self.findCards('cid:{} is:new'.format(card)):
+            if card in new:
                 due.append(True)
+            elif card not in latest:
+                raise Exception('card has no reviews: {}'.format(card))
             else:
-                date, ivl = self.collection().db.all('select id/1000.0, ivl from revlog where cid = ?', card)[-1]
+                date, ivl = latest[card]
                 if ivl >= -1200:
-                    due.append(bool(self.findCards('cid:{} is:due'.format(card))))
+                    due.append(card in dueBySearch)
                 else:
                     due.append(date - ivl <= time.time())
 
@@ -1039,19 +1360,50 @@ class AnkiConnect:
 
     @util.api()
     def getIntervals(self, cards, complete=False):
+        new = self.findCardsAmong(cards, 'is:new')
+        if complete:
+            history = {}
+            for chunk, placeholders in util.queryChunks(set(cards) - new):
+                query = 'select cid, ivl from revlog where cid in ({}) order by cid, id'.format(placeholders)
+                for cid, ivl in self.collection().db.execute(query, *chunk):
+                    history.setdefault(cid, []).append(ivl)
+        else:
+            latest = self.latestReviews(set(cards) - new)
+
         intervals = []
         for card in cards:
-            if self.findCards('cid:{} is:new'.format(card)):
+            if card in new:
                 intervals.append(0)
+            elif complete:
+                intervals.append(history.get(card, []))
+            elif card not in latest:
+                raise Exception('card has no reviews: {}'.format(card))
             else:
-                interval = self.collection().db.list('select ivl from revlog where cid = ?', card)
-                if not complete:
-                    interval = interval[-1]
-                intervals.append(interval)
+                intervals.append(latest[card][1])
 
         return intervals
 
 
+    def findCardsAmong(self, cards, query):
+        # the ids among the given ones of the cards matching a query, in a single search
+        cards = set(cards)
+        if not cards:
+            return set()
+
+        return set(self.collection().findCards('cid:{} {}'.format(','.join(map(str, cards)), query)))
+
+
+    def latestReviews(self, cards):
+        # the time in seconds and the interval of the latest review of each card.
+        # the interval of a bare column is the one of the row with the maximum id
+        latest = {}
+        for chunk, placeholders in util.queryChunks(set(cards)):
+            query = 'select cid, max(id), ivl from revlog where cid in ({}) group by cid'.format(placeholders)
+            for cid, reviewId, ivl in self.collection().db.execute(query, *chunk):
+                latest[cid] = (reviewId / 1000.0, ivl)
+
+        return latest
+
 
     @util.api()
     def modelNames(self):
@@ -1434,79 +1786,305 @@ class AnkiConnect:
 
 
     @util.api()
-    def findNotes(self, query=None):
+    def findNotes(self, query=None, limit=None, order=False, cursor=None):
+        if limit is not None or cursor is not None:
+            notes, cursor, total = self.findPage('notes', query, limit, order, cursor)
+            return {'notes': notes, 'cursor': cursor, 'total': total}
+
         if query is None:
             return []
 
-        return list(map(int, self.collection().findNotes(query)))
+        return list(self.findIds('notes', query, order)[1])
 
 
     @util.api()
-    def findCards(self, query=None):
+    def findCards(self, query=None, limit=None, order=False, cursor=None):
+        if limit is not None or cursor is not None:
+            cards, cursor, total = self.findPage('cards', query, limit, order, cursor)
+            return {'cards': cards, 'cursor': cursor, 'total': total}
+
         if query is None:
             return []
 
-        return list(map(int, self.collection().findCards(query)))
+        return list(self.findIds('cards', query, order)[1])
+
+
+    def findIds(self, kind, query, order, token=None, snapshot=False):
+        # the change token of the collection and the ids of the notes or cards
+        # found by a query, from the cache if they were found with the token.
+        # searches that depend on the time are only cached for pagination
+        collection = self.collection()
+        key = (kind, query, order)
+        cached = snapshot or self.resultSets.isCacheable(query)
+        if token is None:
+            token = self.resultSets.token(collection)
+
+        ids = self.resultSets.get(key, token) if cached else None
+        if ids is None:
+            if kind == 'notes':
+                ids = list(map(int, collection.findNotes(query, order=order)))
+            else:
+                ids = list(map(int, collection.findCards(query, order=order)))
+            token = self.resultSets.token(collection)
+            if cached:
+                self.resultSets.put(key, token, ids)
+
+        return token, ids
+
+
+    def findPage(self, kind, query, limit, order, cursor):
+        # a page of the ids of the notes or cards found by a query, the cursor of
+        # the next page if there is one, and the number of ids found in total.
+        # all pages of a cursor are cut from the result set of its first page.
+        # once that is no longer cached, the cursor has expired
+        token, offset = None, 0
+        if cursor is not None:
+            state = util.decodeCursor(cursor)
+            if state.get('kind') != kind:
+                raise Exception('cursor is not valid for {}: {}'.format(kind, cursor))
+            query, order, token, offset = state['query'], state['order'], state['token'], state['offset']
+            if limit is None:
+                limit = state['limit']
+
+        self.checkLimit(limit)
+        if query is None:
+            return [], None, 0
+
+        foundToken, ids = self.findIds(kind, query, order, token, snapshot=True)
+        if token is not None and foundToken != token:
+            raise Exception('cursor has expired, the search has to be started again: {}'.format(cursor))
+
+        token = foundToken
+        page = ids[offset : offset + limit]
+        offset += len(page)
+        if offset < len(ids):
+            state = {'kind': kind, 'query': query, 'order': order, 'token': token, 'offset': offset, 'limit': limit}
+            return page, util.encodeCursor(state), len(ids)
+
+        return page, None, len(ids)
+
+
+    def checkLimit(self, limit):
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+            raise Exception('limit must be a positive integer: {}'.format(limit))
+
+
+    @util.api()
+    def searchFacets(self, query, facets=None, countOnly=False):
+        # the number of cards found by a query, in total and by deck, note type,
+        # tag, queue and type. only the counts are read, in grouped queries
+        cards = self.findIds('cards', query, False)[1]
+        if countOnly:
+            return {'total': len(cards)}
+
+        names = ['decks', 'models', 'tags', 'queues', 'types']
+        if facets is not None:
+            unknown = set(facets) - set(names)
+            if unknown:
+                raise Exception('facets are not valid: {}'.format(', '.join(sorted(unknown))))
+            names = [name for name in names if name in facets]
+
+        collection = self.collection()
+        counts = {name: collections.Counter() for name in names}
+        for chunk, placeholders in util.queryChunks(cards):
+            query = ('select c.did, n.mid, c.queue, c.type, n.tags, count() from cards c join notes n on n.id = c.nid '
+                     'where c.id in ({}) group by c.did, n.mid, c.queue, c.type, n.tags').format(placeholders)
+            for did, mid, queue, ctype, tags, count in collection.db.execute(query, *chunk):
+                for name, key in (('decks', did), ('models', mid), ('queues', queue), ('types', ctype)):
+                    if name in counts:
+                        counts[name][key] += count
+                if 'tags' in counts:
+                    for tag in set(re.split('[ \u3000]', tags)):
+                        if tag:
+                            counts['tags'][tag] += count
+
+        result = {'total': len(cards)}
+        for name in names:
+            if name == 'decks':
+                result[name] = {self.deckNameFromId(did): count for did, count in counts[name].items()}
+            elif name == 'models':
+                result[name] = {collection.models.get(mid)['name']: count for mid, count in counts[name].items()}
+            else:
+                result[name] = dict(counts[name])
+
+        return result
 
 
     @util.api()
-    def cardsInfo(self, cards):
+    def cardsInfo(self, cards=None, fields=None, attributes=None, normalized=False,
+                  query=None, limit=None, order=False, cursor=None):
+        # only the requested attributes and note fields are loaded, and
+        # questions and answers are only rendered when they are requested.
+        # normalized results refer to models and decks by id, and list
+        # their names and css only once, without css in questions and answers.
+        # without ids, a page of the cards found by a query is returned
+        if cards is None:
+            cards, cursor, total = self.findPage('cards', query, limit, order, cursor)
+            page = self.cardsInfo(cards, fields, attributes, normalized)
+            if not normalized:
+                page = {'cards': page}
+            page.update(cursor=cursor, total=total)
+            return page
+
+        def wanted(attribute):
+            return attributes is None or attribute in attributes
+
+        collection = self.collection()
+        render = wanted('question') or wanted('answer')
+        columns = 'c.id, c.nid, c.did, c.ord, c.type, c.queue, c.due, c.ivl, c.factor, c.reps, c.lapses, c.left, c.mod, n.mid'
+        if wanted('fields') or render:
+            columns += ', n.flds'
+        if render:
+            columns += ', n.mod, n.tags, c.odid, c.flags'
+            self.renderCache.bind(collection)
+
+        rows = {}
+        for chunk, placeholders in util.queryChunks(set(cards)):
+            query = 'select {} from cards c join notes n on n.id = c.nid where c.id in ({})'.format(columns, placeholders)
+            for row in collection.db.execute(query, *chunk):
+                rows[row[0]] = row
+
+        models = {}
+        modelKeys = {}
+        deckNames = {}
+        homeDeckNames = {}
+
         result = []
         for cid in cards:
-            try:
-                card = self.getCard(cid)
-                model = card.model()
-                note = card.note()
-                fields = {}
-                for info in model['flds']:
-                    order = info['ord']
-                    name = info['name']
-                    fields[name] = {'value': note.fields[order], 'order': order}
-
-                result.append({
-                    'cardId': card.id,
-                    'fields': fields,
-                    'fieldOrder': card.ord,
-                    'question': util.cardQuestion(card),
-                    'answer': util.cardAnswer(card),
-                    'modelName': model['name'],
-                    'ord': card.ord,
-                    'deckName': self.deckNameFromId(card.did),
-                    'css': model['css'],
-                    'factor': card.factor,
-                    #This factor is 10 times the ease percentage,
-                    # so an ease of 310% would be reported as 3100
-                    'interval': card.ivl,
-                    'note': card.nid,
-                    'type': card.type,
-                    'queue': card.queue,
-                    'due': card.due,
-                    'reps': card.reps,
-                    'lapses': card.lapses,
-                    'left': card.left,
-                    'mod': card.mod,
-                })
-            except NotFoundError:
-                # Anki will give a NotFoundError if the card ID does not exist.
+            row = rows.get(cid)
+            if row is None:
                 # Best behavior is probably to add an 'empty card' to the
                 # returned result, so that the items of the input and return
                 # lists correspond.
                 result.append({})
+                continue
+
+            cardId, nid, did, cardOrd, ctype, queue, due, ivl, factor, reps, lapses, left, mod, mid = row[:14]
+            if mid not in models:
+                models[mid] = collection.models.get(mid)
+                modelKeys[mid] = modelKey(models[mid])
+            model = models[mid]
+
+            info = {'cardId': cardId}
+            if wanted('fields'):
+                info['fields'] = self.fieldsOfNote(*self.noteFieldValues(nid, model, row[14]), fields)
+            if wanted('fieldOrder'):
+                info['fieldOrder'] = cardOrd
+            if render:
+                # filtered cards show the name of their home deck
+                homeDid = row[17] or did
+                if homeDid not in homeDeckNames:
+                    homeDeckNames[homeDid] = self.deckNameFromId(homeDid)
+                key = (cardId, cardOrd, did, homeDeckNames[homeDid], row[18],
+                       noteKey(row[15], row[14], row[16]), modelKeys[mid])
+                question, answer = self.renderCache.get(key, lambda: self.renderCard(self.getCard(cardId)))
+                if normalized:
+                    question = util.withoutStyle(question, model['css'])
+                    answer = util.withoutStyle(answer, model['css'])
+                if wanted('question'):
+                    info['question'] = question
+                if wanted('answer'):
+                    info['answer'] = answer
+            if normalized:
+                if wanted('modelName') or wanted('css'):
+                    info['modelId'] = mid
+            elif wanted('modelName'):
+                info['modelName'] = model['name']
+            if wanted('ord'):
+                info['ord'] = cardOrd
+            if wanted('deckName'):
+                if did not in deckNames:
+                    deckNames[did] = self.deckNameFromId(did)
+                if normalized:
+                    info['deckId'] = did
+                else:
+                    info['deckName'] = deckNames[did]
+            if wanted('css') and not normalized:
+                info['css'] = model['css']
+
+            # This factor is 10 times the ease percentage,
+            # so an ease of 310% would be reported as 3100
+            for attribute, value in (('factor', factor), ('interval', ivl), ('note', nid), ('type', ctype),
+                                     ('queue', queue), ('due', due), ('reps', reps), ('lapses', lapses),
+                                     ('left', left), ('mod', mod)):
+                if wanted(attribute):
+                    info[attribute] = value
+
+            result.append(info)
+
+        if render:
+            self.renderCache.flush()
+
+        if normalized:
+            attributes = [attribute for attribute in ('modelName', 'css') if wanted(attribute)]
+            return {'cards': result, 'models': self.modelTable(models, attributes), 'decks': deckNames}
 
         return result
 
+
+    def modelTable(self, models, attributes):
+        # the models of a normalized result, with the given attributes
+        names = {'modelName': 'name', 'css': 'css'}
+        table = {}
+        for mid, model in models.items():
+            if attributes:
+                table[mid] = {names[attribute]: model[names[attribute]] for attribute in attributes}
+        return table
+
+
+    def renderCard(self, card):
+        return util.cardQuestion(card), util.cardAnswer(card)
+
+
+    def renderCardCached(self, card, model):
+        collection = self.collection()
+        self.renderCache.bind(collection)
+
+        mod, flds, tags = collection.db.first('select mod, flds, tags from notes where id = ?', card.nid)
+        deckName = self.deckNameFromId(card.odid or card.did)
+        key = (card.id, card.ord, card.did, deckName, card.flags, noteKey(mod, flds, tags), modelKey(model))
+        rendered = self.renderCache.get(key, lambda: self.renderCard(card))
+        self.renderCache.flush()
+
+        return rendered
+
+
+    def noteFieldValues(self, nid, model, flds):
+        # the model and field values of a note, as stored in its row
+        values = flds.split('\x1f')
+        if model is None or len(values) != len(model['flds']):
+            # let Anki deal with notes that do not match their model
+            note = self.getNote(nid)
+            return note.model(), note.fields
+
+        return model, values
+
+
+    def fieldsOfNote(self, model, values, names=None):
+        # the fields of a note as returned by cardsInfo and notesInfo,
+        # optionally only the ones with the given names. fields missing
+        # from the note are empty, as Anki shows them
+        fields = {}
+        for info in model['flds']:
+            name = info['name']
+            if names is None or name in names:
+                order = info['ord']
+                value = values[order] if order < len(values) else ''
+                fields[name] = {'value': value, 'order': order}
+
+        return fields
+
     @util.api()
     def cardsModTime(self, cards):
+        values = CardBatch(self.collection()).read(cards, ['mod'])
         result = []
         for cid in cards:
-            try:
-                card = self.getCard(cid)
+            if cid in values:
                 result.append({
-                    'cardId': card.id,
-                    'mod': card.mod,
+                    'cardId': cid,
+                    'mod': values[cid]['mod'],
                 })
-            except NotFoundError:
-                # Anki will give a NotFoundError if the card ID does not exist.
+            else:
                 # Best behavior is probably to add an 'empty card' to the
                 # returned result, so that the items of the input and return
                 # lists correspond.
@@ -1519,6 +2097,7 @@ class AnkiConnect:
         self.startEditing()
         scids = anki.utils.ids2str(cards)
         self.collection().db.execute('update cards set type=0, queue=0, left=0, ivl=0, due=0, odue=0, factor=0 where id in ' + scids)
+        self.reviewCounts.invalidate()
         self.stopEditing()
 
 
@@ -1527,6 +2106,7 @@ class AnkiConnect:
         self.startEditing()
         scids = anki.utils.ids2str(cards)
         self.collection().db.execute('update cards set type=3, queue=1 where id in ' + scids)
+        self.reviewCounts.invalidate()
         self.stopEditing()
 
 
@@ -1549,23 +2129,63 @@ class AnkiConnect:
 
 
     @util.api()
-    def cardReviews(self, deck, startID):
-        return self.database().all(
-            'select id, cid, usn, ease, ivl, lastIvl, factor, time, type from revlog ''where id>? and cid in (select id from cards where did=?)',
-            startID,
-            self.decks().id(deck)
-        )
+    def cardReviews(self, deck, startID, limit=None, columnar=False):
+        # reviews after startID in the order of their ids, at most limit of them.
+        # the id of the last review returned is the startID of the next page
+        COLUMNS = ['id', 'cid', 'usn', 'ease', 'ivl', 'lastIvl', 'factor', 'time', 'type']
+        query = 'select {} from revlog where id>? and cid in (select id from cards where did=?) order by id'.format(', '.join(COLUMNS))
+        args = [startID, self.decks().id(deck)]
+        if limit is not None:
+            self.checkLimit(limit)
+            query += ' limit ?'
+            args.append(limit)
+
+        rows = self.database().all(query, *args)
+        if columnar:
+            return {column: [row[index] for row in rows] for index, column in enumerate(COLUMNS)}
+
+        return rows
 
 
     @util.api()
-    def getReviewsOfCards(self, cards):
+    def getReviewsOfCards(self, cards, limit=None, startID=None, columnar=False):
+        # reviews of each card in the order of their ids. with a limit, only the
+        # first reviews after startID of all cards together are returned, and
+        # the largest id returned is the startID of the next page
         COLUMNS = ['id', 'usn', 'ease', 'ivl', 'lastIvl', 'factor', 'time', 'type']
-        QUERY = 'select {} from revlog where cid = ?'.format(', '.join(COLUMNS))
-
-        result = {}
-        for card in cards:
-            query_result = self.database().all(QUERY, card)
-            result[card] = [dict(zip(COLUMNS, row)) for row in query_result]
+        query = 'select cid, {} from revlog where cid in ({{}})'.format(', '.join(COLUMNS))
+        args = []
+        if startID is not None:
+            query += ' and id > ?'
+            args.append(startID)
+        query += ' order by id'
+        if limit is not None:
+            self.checkLimit(limit)
+            query += ' limit ?'
+            args.append(limit)
+
+        rows = []
+        chunks = 0
+        for chunk, placeholders in util.queryChunks(set(cards)):
+            rows.extend(self.database().all(query.format(placeholders), *chunk, *args))
+            chunks += 1
+
+        # reviews of different chunks are merged in the order of their ids
+        if chunks > 1:
+            rows.sort(key=lambda row: row[1])
+            if limit is not None:
+                del rows[limit:]
+
+        if columnar:
+            result = {card: {column: [] for column in COLUMNS} for card in cards}
+            for row in rows:
+                reviews = result[row[0]]
+                for column, value in zip(COLUMNS, row[1:]):
+                    reviews[column].append(value)
+        else:
+            result = {card: [] for card in cards}
+            for row in rows:
+                result[row[0]].append(dict(zip(COLUMNS, row[1:])))
 
         return result
 
@@ -1585,42 +2205,126 @@ class AnkiConnect:
 
 
     @util.api()
-    def insertReviews(self, reviews):
-        if len(reviews) > 0:
-            sql = 'insert into revlog(id,cid,usn,ease,ivl,lastIvl,factor,time,type) values '
-            for row in reviews:
-                sql += '(%s),' % ','.join(map(str, row))
-            sql = sql[:-1]
-            self.database().execute(sql)
+    def insertReviews(self, reviews, skipExisting=False):
+        return jobs.runSteps(self.insertReviewsSteps(reviews, skipExisting))
+
+
+    def insertReviewsSteps(self, reviews, skipExisting=False):
+        # all reviews are validated, and their ids checked against the revlog,
+        # before the first one is inserted. reviews whose ids exist already are
+        # an error, or skipped. returns how many reviews were inserted
+        COLUMNS = ['id', 'cid', 'usn', 'ease', 'ivl', 'lastIvl', 'factor', 'time', 'type']
+        CHUNK_SIZE = 1000
+
+        # the types of all values are checked at once, each review only to find an invalid one
+        if {*map(type, reviews)} - {list, tuple} or {*map(len, reviews)} - {len(COLUMNS)} or \
+                {*map(type, itertools.chain.from_iterable(reviews))} - {int}:
+            for index, review in enumerate(reviews):
+                if not isinstance(review, (list, tuple)) or len(review) != len(COLUMNS) or \
+                        not all(type(value) is int for value in review):
+                    raise Exception('review {} is not valid, it must be a list of {} integers ({}): {}'.format(
+                        index, len(COLUMNS), ', '.join(COLUMNS), review))
+
+        existing = set()
+        for chunk, placeholders in util.queryChunks({review[0] for review in reviews}):
+            existing.update(self.database().list('select id from revlog where id in ({})'.format(placeholders), *chunk))
+
+        rows = []
+        ids = set()
+        for review in reviews:
+            if review[0] in existing or review[0] in ids:
+                if skipExisting:
+                    continue
+                if review[0] in existing:
+                    raise Exception('review id already exists: {}'.format(review[0]))
+                raise Exception('review id is not unique: {}'.format(review[0]))
+            ids.add(review[0])
+            rows.append(review)
+
+        query = 'insert into revlog({}) values ({})'.format(','.join(COLUMNS), ','.join('?' * len(COLUMNS)))
+        for start in range(0, len(rows), CHUNK_SIZE):
+            yield start, len(rows)
+            self.database().executemany(query, rows[start : start + CHUNK_SIZE])
+
+        # reviews from before the newest one are not picked up by an update
+        if rows:
+            self.reviewCounts.invalidate()
+
+        self.autosave()
+        return len(rows)
+
+
+    @util.api()
+    def notesInfo(self, notes=None, fields=None, attributes=None, normalized=False,
+                  query=None, limit=None, order=False, cursor=None):
+        # only the requested attributes and note fields are loaded. normalized
+        # results refer to models by id, and list their names only once.
+        # without ids, a page of the notes found by a query is returned
+        if notes is None:
+            notes, cursor, total = self.findPage('notes', query, limit, order, cursor)
+            page = self.notesInfo(notes, fields, attributes, normalized)
+            if not normalized:
+                page = {'notes': page}
+            page.update(cursor=cursor, total=total)
+            return page
+
+        def wanted(attribute):
+            return attributes is None or attribute in attributes
 
+        collection = self.collection()
+        columns = 'id, mid, tags, flds' if wanted('fields') else 'id, mid, tags'
 
-    @util.api()
-    def notesInfo(self, notes):
-        result = []
-        for nid in notes:
-            try:
-                note = self.getNote(nid)
-                model = note.model()
+        # notes and their cards are read for all ids at once, in chunks
+        rows = {}
+        cards = {}
+        for chunk, placeholders in util.queryChunks(set(notes)):
+            query = 'select {} from notes where id in ({})'.format(columns, placeholders)
+            for row in collection.db.execute(query, *chunk):
+                rows[row[0]] = row
 
-                fields = {}
-                for info in model['flds']:
-                    order = info['ord']
-                    name = info['name']
-                    fields[name] = {'value': note.fields[order], 'order': order}
+            if wanted('cards'):
+                query = 'select nid, id from cards where nid in ({}) order by nid, ord'.format(placeholders)
+                for nid, cid in collection.db.execute(query, *chunk):
+                    cards.setdefault(nid, []).append(cid)
 
-                result.append({
-                    'noteId': note.id,
-                    'tags' : note.tags,
-                    'fields': fields,
-                    'modelName': model['name'],
-                    'cards': self.collection().db.list('select id from cards where nid = ? order by ord', note.id)
-                })
-            except NotFoundError:
-                # Anki will give a NotFoundError if the note ID does not exist.
+        models = {}
+
+        result = []
+        for nid in notes:
+            row = rows.get(nid)
+            if row is None:
                 # Best behavior is probably to add an 'empty card' to the
                 # returned result, so that the items of the input and return
                 # lists correspond.
                 result.append({})
+                continue
+
+            noteId, mid, tags = row[:3]
+            if mid not in models:
+                models[mid] = collection.models.get(mid)
+            model = models[mid]
+
+            if wanted('fields'):
+                model, values = self.noteFieldValues(noteId, model, row[3])
+
+            info = {'noteId': noteId}
+            if wanted('tags'):
+                info['tags'] = [tag for tag in re.split('[ \u3000]', tags) if tag]
+            if wanted('fields'):
+                info['fields'] = self.fieldsOfNote(model, values, fields)
+            if wanted('modelName'):
+                if normalized:
+                    info['modelId'] = mid
+                else:
+                    info['modelName'] = model['name']
+            if wanted('cards'):
+                info['cards'] = cards.get(noteId, [])
+
+            result.append(info)
+
+        if normalized:
+            attributes = ['modelName'] if wanted('modelName') else []
+            return {'notes': result, 'models': self.modelTable(models, attributes)}
 
         return result
 
@@ -1742,7 +2446,7 @@ class AnkiConnect:
 
 
     @util.api()
-    def guiCurrentCard(self):
+    def guiCurrentCard(self, normalized=False):
         if not self.guiReviewActive():
             raise Exception('Gui review is not currently active.')
 
@@ -1757,13 +2461,15 @@ class AnkiConnect:
             name = info['name']
             fields[name] = {'value': note.fields[order], 'order': order}
 
+        question, answer = self.renderCardCached(card, model)
+
         buttonList = reviewer._answerButtonList()
-        return {
+        info = {
             'cardId': card.id,
             'fields': fields,
             'fieldOrder': card.ord,
-            'question': util.cardQuestion(card),
-            'answer': util.cardAnswer(card),
+            'question': question,
+            'answer': answer,
             'buttons': [b[0] for b in buttonList],
             'nextReviews': [reviewer.mw.col.sched.nextIvlStr(reviewer.card, b[0], True) for b in buttonList],
             'modelName': model['name'],
@@ -1772,6 +2478,21 @@ class AnkiConnect:
             'template': card.template()['name']
         }
 
+        if normalized:
+            deckName = info.pop('deckName')
+            del info['modelName'], info['css']
+            info['question'] = util.withoutStyle(question, model['css'])
+            info['answer'] = util.withoutStyle(answer, model['css'])
+            info['modelId'] = model['id']
+            info['deckId'] = card.did
+            return {
+                'card': info,
+                'models': self.modelTable({model['id']: model}, ['modelName', 'css']),
+                'decks': {card.did: deckName},
+            }
+
+        return info
+
 
     @util.api()
     def guiStartCardTimer(self):
@@ -1909,56 +2630,101 @@ class AnkiConnect:
 
     @util.api()
     def addNotes(self, notes):
+        # models, decks and duplicates are looked up for all notes at once,
+        # and the collection is saved and the main window reset only once
+        collection = self.collection()
+        batch = NoteBatch(collection, notes)
+
         results = []
+        self.startEditing()
         for note in notes:
             try:
-                results.append(self.addNote(note))
+                ankiNote = self.createNote(note, batch)
+                nCardsAdded = collection.addNote(ankiNote)
+                batch.add(ankiNote)
+                if nCardsAdded < 1:
+                    raise Exception('The field values you have provided would make an empty question on all cards.')
+                results.append(ankiNote.id)
             except:
                 results.append(None)
+        self.autosave()
+        self.stopEditing()
 
         return results
 
 
     @util.api()
     def canAddNotes(self, notes):
+        batch = NoteBatch(self.collection(), notes)
+
         results = []
         for note in notes:
-            results.append(self.canAddNote(note))
+            try:
+                results.append(bool(self.createNote(note, batch)))
+            except:
+                results.append(False)
 
         return results
 
 
     @util.api()
     def exportPackage(self, deck, path, includeSched=False):
+        exporter = self.packageExporter(deck, includeSched)
+        if exporter is None:
+            return False
+
+        exporter.exportInto(path)
+        return True
+
+
+    def exportPackageSteps(self, deck, path, includeSched=False):
+        # as a job, the package is written on a background thread, as Anki does
+        exporter = self.packageExporter(deck, includeSched)
+        if exporter is None:
+            return False
+
+        yield from jobs.backgroundSteps(self.window().taskman.with_progress, lambda: exporter.exportInto(path))
+        return True
+
+
+    def packageExporter(self, deckName, includeSched):
         collection = self.collection()
-        if collection is not None:
-            deck = collection.decks.byName(deck)
-            if deck is not None:
-                exporter = AnkiPackageExporter(collection)
-                exporter.did = deck['id']
-                exporter.includeSched = includeSched
-                exporter.exportInto(path)
-                return True
+        deck = collection.decks.byName(deckName)
+        if deck is None:
+            return None
 
-        return False
+        exporter = AnkiPackageExporter(collection)
+        exporter.did = deck['id']
+        exporter.includeSched = includeSched
+        return exporter
 
 
     @util.api()
     def importPackage(self, path):
         collection = self.collection()
-        if collection is not None:
-            try:
-                self.startEditing()
-                importer = AnkiPackageImporter(collection, path)
-                importer.run()
-            except:
-                self.stopEditing()
-                raise
-            else:
-                self.stopEditing()
-                return True
+        try:
+            self.startEditing()
+            importer = AnkiPackageImporter(collection, path)
+            importer.run()
+        finally:
+            self.stopEditing()
+            self.reviewCounts.invalidate()
 
-        return False
+        return True
+
+
+    def importPackageSteps(self, path):
+        # as a job, the package is read on a background thread, as Anki does
+        collection = self.collection()
+        try:
+            self.startEditing()
+            importer = AnkiPackageImporter(collection, path)
+            yield from jobs.backgroundSteps(self.window().taskman.with_progress, importer.run)
+        finally:
+            self.stopEditing()
+            self.reviewCounts.invalidate()
+
+        return True
 
 
     @util.api()
@@ -1968,20 +2734,17 @@ class AnkiConnect:
         if not (actions is None or isinstance(actions, list)):
             raise Exception('actions has invalid value')
 
-        cls = type(self)
+        methods = self.apiMethods()
         scopes2 = []
         result = {'scopes': scopes2}
 
         if 'actions' in scopes:
             if actions is None:
-                actions = dir(cls)
+                actions = list(methods)
 
             methodNames = []
             for methodName in actions:
-                if not isinstance(methodName, str):
-                    pass
-                method = getattr(cls, methodName, None)
-                if method is not None and getattr(method, 'api', False):
+                if isinstance(methodName, str) and methodName in methods:
                     methodNames.append(methodName)
 
             scopes2.append('actions')
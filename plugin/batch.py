@@ -0,0 +1,266 @@
+# Copyright 2016-2021 Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import unicodedata
+
+import anki.utils
+from anki.consts import MODEL_CLOZE
+
+from . import util
+
+
+def isPlainText(text):
+    # text that Anki's html stripping and unicode normalization leave as is
+    return '<' not in text and '&' not in text and unicodedata.is_normalized('NFC', text)
+
+
+def fieldChecksum(text):
+    # same as anki.utils.fieldChecksum, without a trip to the backend for plain text
+    if isPlainText(text):
+        return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    return anki.utils.fieldChecksum(text)
+
+
+#
+# NoteBatch
+#
+
+class NoteBatch:
+    # Resolves models and decks once for all notes of a batch, and keeps an index
+    # of the first field checksums of the notes in the collection, with the decks
+    # of their cards. Duplicates in any scope are looked up in the index, which is
+    # filled for the whole batch with a few queries.
+
+    def __init__(self, collection, notes=()):
+        self.collection = collection
+        self.models = {}
+        self.decks = {}
+        self.scopes = {}
+        self.notes = {}
+        self.noteDecks = {}
+        self.pendingNoteIds = []
+        self.loaded = set()
+        self.prefetch(notes)
+
+
+    def model(self, name):
+        if name not in self.models:
+            self.models[name] = self.collection.models.byName(name)
+        return self.models[name]
+
+
+    def deck(self, name):
+        if name not in self.decks:
+            self.decks[name] = self.collection.decks.byName(name)
+        return self.decks[name]
+
+
+    def scope(self, deckId, checkChildren):
+        # ids of the decks a duplicate has to have a card in
+        key = (deckId, checkChildren)
+        if key not in self.scopes:
+            deckIds = {deckId}
+            if checkChildren:
+                deckIds.update(childId for _, childId in self.collection.decks.children(deckId))
+            self.scopes[key] = deckIds
+        return self.scopes[key]
+
+
+    def prefetch(self, notes):
+        # looks up the checksums of all notes of the batch at once
+        checksums = []
+        for note in notes:
+            try:
+                model = self.model(note['modelName'])
+                if model is None:
+                    continue
+                firstName = model['flds'][0]['name'].lower()
+                for name, value in note['fields'].items():
+                    if name.lower() == firstName:
+                        checksums.append(fieldChecksum(value))
+            except Exception:
+                pass  # the note is rejected when it is created
+
+        self.load(checksums)
+
+
+    def load(self, checksums):
+        missing = set(checksums) - self.loaded
+        for chunk, placeholders in util.queryChunks(missing):
+            query = 'select n.csum, n.id, n.mid, c.did from notes n left join cards c on c.nid = n.id where n.csum in ({})'
+            for csum, noteId, mid, deckId in self.collection.db.execute(query.format(placeholders), *chunk):
+                self.addRow(csum, noteId, mid, deckId)
+
+        self.loaded.update(missing)
+
+
+    def addRow(self, csum, noteId, mid, deckId):
+        if noteId not in self.noteDecks:
+            self.notes.setdefault(csum, []).append((noteId, mid))
+            self.noteDecks[noteId] = set()
+        if deckId is not None:
+            self.noteDecks[noteId].add(deckId)
+
+
+    def loadPendingDecks(self):
+        # decks of the cards of notes added during the batch, only once they are needed
+        pending = self.pendingNoteIds
+        self.pendingNoteIds = []
+        for chunk, placeholders in util.queryChunks(pending):
+            query = 'select nid, did from cards where nid in ({})'.format(placeholders)
+            for noteId, deckId in self.collection.db.execute(query, *chunk):
+                self.noteDecks[noteId].add(deckId)
+
+
+    def contains(self, csum, mid=None, deckIds=None, excludeNoteId=None):
+        # true if a note with the checksum exists; of the given model, with a card
+        # in one of the given decks and other than the given note if those are set
+        self.load([csum])
+        if deckIds is not None and self.pendingNoteIds:
+            self.loadPendingDecks()
+
+        for noteId, noteMid in self.notes.get(csum, ()):
+            if noteId == excludeNoteId or (mid is not None and noteMid != mid):
+                continue
+            if deckIds is None or not deckIds.isdisjoint(self.noteDecks[noteId]):
+                return True
+
+        return False
+
+
+    def isUnique(self, note, model):
+        # true if Anki's own check of the note would find it neither empty,
+        # nor a duplicate, nor with cloze problems. false if unsure
+        text = note.fields[0]
+        if not text.strip() or not isPlainText(text):
+            return False
+        if model['type'] == MODEL_CLOZE or any('{{c' in field for field in note.fields):
+            return False
+
+        return not self.contains(fieldChecksum(text), note.mid)
+
+
+    def add(self, note):
+        # the checksum of a note that was just added, as Anki stored it
+        if not note.id:
+            return
+
+        text = note.fields[0]
+        if isPlainText(text):
+            csum = fieldChecksum(text)
+        else:
+            csum = self.collection.db.scalar('select csum from notes where id = ?', note.id)
+
+        self.load([csum])
+        self.addRow(csum, note.id, note.mid, None)
+        self.pendingNoteIds.append(note.id)
+
+
+#
+# CardBatch
+#
+
+# columns of the cards table that can be read and written for many cards at
+# once. all of them are integers. card data is left to Anki, which validates it
+CARD_COLUMNS = ('nid', 'did', 'ord', 'mod', 'usn', 'type', 'queue', 'due', 'ivl', 'factor',
+                'reps', 'lapses', 'left', 'odue', 'odid', 'flags')
+
+# the modification time and update sequence number are set by every write
+WRITABLE_CARD_COLUMNS = tuple(column for column in CARD_COLUMNS if column not in ('mod', 'usn'))
+
+
+class CardBatch:
+    # Reads columns of many cards with a query per chunk of cards, and writes
+    # them through Anki with a single call where Anki supports it. Writing sql
+    # directly would clear the undo queue and the study queues. Written cards
+    # get a new modification time and update sequence number from Anki.
+
+    def __init__(self, collection):
+        self.collection = collection
+
+
+    def checkColumns(self, columns, valid=CARD_COLUMNS):
+        for column in columns:
+            if column not in valid:
+                raise Exception('card column is not valid: {}'.format(column))
+
+
+    def read(self, cards, columns):
+        # the values of the columns of the cards that exist, by card id
+        self.checkColumns(columns)
+        selected = ', '.join(('id',) + tuple(columns))
+
+        values = {}
+        for chunk, placeholders in util.queryChunks(set(cards)):
+            query = 'select {} from cards where id in ({})'.format(selected, placeholders)
+            for row in self.collection.db.execute(query, *chunk):
+                values[row[0]] = dict(zip(columns, row[1:]))
+
+        return values
+
+
+    def write(self, cards, updates):
+        # sets the columns of each card to the values of its update, and returns
+        # whether each card exists. nothing is written if a value is not valid
+        for update in updates:
+            self.checkColumns(update, WRITABLE_CARD_COLUMNS)
+            for column, value in update.items():
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise Exception('value of card column {} is not valid: {}'.format(column, value))
+        self.checkReferences(updates)
+
+        existing = self.read(cards, [])
+        loaded = {}
+        for card, update in zip(cards, updates):
+            if card in existing:
+                if card not in loaded:
+                    loaded[card] = self.collection.getCard(card)
+                for column, value in update.items():
+                    setattr(loaded[card], column, value)
+
+        if loaded:
+            if hasattr(self.collection, 'update_cards'):
+                self.collection.update_cards(list(loaded.values()))
+            else:
+                for ankiCard in loaded.values():
+                    ankiCard.flush()
+
+        return [card in existing for card in cards]
+
+
+    def checkReferences(self, updates):
+        # cards can only be moved to decks and notes that exist. cards that
+        # are not in a filtered deck have no original deck
+        deckIds = set()
+        noteIds = set()
+        for update in updates:
+            if 'did' in update:
+                deckIds.add(update['did'])
+            if update.get('odid'):
+                deckIds.add(update['odid'])
+            if 'nid' in update:
+                noteIds.add(update['nid'])
+
+        for deckId in deckIds:
+            if self.collection.decks.get(deckId, default=False) is None:
+                raise Exception('deck was not found: {}'.format(deckId))
+
+        missing = set(noteIds)
+        for chunk, placeholders in util.queryChunks(noteIds):
+            query = 'select id from notes where id in ({})'.format(placeholders)
+            missing.difference_update(self.collection.db.list(query, *chunk))
+        if missing:
+            raise Exception('note was not found: {}'.format(min(missing)))
@@ -0,0 +1,318 @@
+# Copyright 2016-2021 Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+
+from . import util
+
+
+def noteKey(mod, flds, tags):
+    # modification times only have a resolution of seconds,
+    # so the content is part of the key as well
+    return mod, zlib.crc32('{}\x1f{}'.format(flds, tags).encode('utf-8'))
+
+
+def modelKey(model):
+    # names are part of the key, as templates can show them
+    templates = ''.join('{}\x1f{}\x1f{}\x1f'.format(template['name'], template['qfmt'], template['afmt'])
+                        for template in model['tmpls'])
+    return model['mod'], zlib.crc32('{}\x1f{}{}'.format(model['name'], templates, model['css']).encode('utf-8'))
+
+
+#
+# RenderCache
+#
+
+class RenderCache:
+    # Rendered questions and answers of cards, least recently used first. Entries
+    # are keyed by everything rendering depends on: the card, its template, its
+    # flags, its deck and the name of that deck, the contents of its note, and
+    # the names and contents of its model and templates, so edits are never
+    # served stale. Optionally backed by a file next to the collection.
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.budget = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collectionPath = None
+        self.disk = None
+        self.diskDirty = False
+
+
+    def bind(self, collection):
+        # entries belong to one collection, and settings may change at any time
+        if collection.path != self.collectionPath:
+            self.clear()
+            self.closeDisk()
+            self.collectionPath = collection.path
+
+        self.budget = util.setting('renderCacheSize') * 1024 * 1024
+        self.evict()
+
+        if util.setting('renderCachePersistent'):
+            if self.disk is None:
+                self.openDisk(os.path.join(os.path.dirname(collection.path), 'ankiconnect-renders.db'))
+        else:
+            self.closeDisk()
+
+
+    def get(self, key, render):
+        # the question and answer stored under the key, rendered if they are not
+        if self.budget <= 0 and self.disk is None:
+            return render()
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        entry = self.loadFromDisk(key)
+        if entry is not None:
+            self.diskHits += 1
+        else:
+            self.misses += 1
+            entry = render()
+            self.saveToDisk(key, entry)
+
+        self.store(key, entry)
+        return entry
+
+
+    def store(self, key, entry):
+        size = sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+        if size > self.budget:
+            return
+
+        self.entries[key] = entry
+        self.size += size
+        self.evict()
+
+
+    def evict(self):
+        while self.size > self.budget and self.entries:
+            _, (question, answer) = self.entries.popitem(last=False)
+            self.size -= sys.getsizeof(question) + sys.getsizeof(answer)
+            self.evictions += 1
+
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+    def flush(self):
+        if self.disk is not None and self.diskDirty:
+            self.disk.commit()
+            self.diskDirty = False
+
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'budget': self.budget,
+            'hits': self.hits,
+            'diskHits': self.diskHits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'persistent': self.disk is not None,
+        }
+
+
+    def openDisk(self, path):
+        self.disk = sqlite3.connect(path)
+        self.disk.execute('create table if not exists renders (cid integer primary key, key text, question text, answer text)')
+
+        # renders from before the cache was made persistent are kept as well
+        for key, entry in self.entries.items():
+            self.saveToDisk(key, entry)
+
+
+    def closeDisk(self):
+        if self.disk is not None:
+            self.flush()
+            self.disk.close()
+            self.disk = None
+
+
+    def loadFromDisk(self, key):
+        if self.disk is None:
+            return None
+
+        row = self.disk.execute('select key, question, answer from renders where cid = ?', (key[0],)).fetchone()
+        if row is None or row[0] != repr(key[1:]):
+            return None
+
+        return row[1], row[2]
+
+
+    def saveToDisk(self, key, entry):
+        # only the latest rendering of a card is kept
+        if self.disk is not None:
+            self.disk.execute('insert or replace into renders values (?, ?, ?, ?)', (key[0], repr(key[1:]), entry[0], entry[1]))
+            self.diskDirty = True
+
+
+#
+# ResultSetCache
+#
+
+# searches whose results change over time, without the collection changing
+TIME_DEPENDENT_SEARCH = re.compile(r'\b(is:due|prop:due|rated:|added:|edited:|introduced:|resched:)', re.IGNORECASE)
+
+
+class ResultSetCache:
+    # Ids found by recent searches, least recently used first. Each result set
+    # is only valid for the change token of the collection it was found with,
+    # and for a limited time.
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    def token(self, collection):
+        # the modification time of the collection is only updated when changes
+        # are saved, so the changes made on its connection are counted as well.
+        # operations and undo in Anki bump the generation through hooks
+        mod, changes = collection.db.first('select mod, total_changes() from col')
+        return [mod, changes, self.generation]
+
+
+    def isCacheable(self, query):
+        return not TIME_DEPENDENT_SEARCH.search(query)
+
+
+    def get(self, key, token):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != token:
+            self.misses += 1
+            return None
+
+        ttl = util.setting('resultSetCacheTtl')
+        if ttl > 0 and time.monotonic() - entry[1] > ttl:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+
+    def put(self, key, token, ids):
+        self.entries[key] = (token, time.monotonic(), ids)
+        self.entries.move_to_end(key)
+        while len(self.entries) > max(util.setting('resultSetCacheSize'), 0):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def invalidate(self, *args):
+        # called by hooks with whatever arguments they pass
+        self.entries.clear()
+        self.generation += 1
+        self.invalidations += 1
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+#
+# ReviewCounts
+#
+
+class ReviewCounts:
+    # Number of reviews by day and by the deck of the reviewed card, when the
+    # review was first counted. Only reviews newer than the ones counted so far
+    # are read on an update. Counting starts over when it is invalidated, when
+    # the newest review was removed, or when days start at another hour.
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.key = None
+        self.lastId = -1
+        self.builds = 0
+        self.updates = 0
+
+
+    def invalidate(self, *args):
+        # called by hooks with whatever arguments they pass
+        self.key = None
+
+
+    def update(self, collection, offset):
+        # offset is the number of seconds after midnight that days start at
+        lastId = collection.db.scalar('select max(id) from revlog') or -1
+        key = (collection.path, offset)
+        if key != self.key or lastId < self.lastId:
+            self.counts = collections.Counter()
+            self.key = key
+            self.lastId = -1
+            self.builds += 1
+        elif lastId == self.lastId:
+            return
+
+        query = ('select date(r.id/1000 - ?, "unixepoch", "localtime") as day, c.did, count() '
+                 'from revlog r left join cards c on c.id = r.cid where r.id > ? group by day, c.did')
+        for day, did, count in collection.db.all(query, offset, self.lastId):
+            self.counts[(day, did)] += count
+
+        self.lastId = lastId
+        self.updates += 1
+
+
+    def byDay(self, deckIds=None):
+        days = collections.Counter()
+        for (day, did), count in self.counts.items():
+            if deckIds is None or did in deckIds:
+                days[day] += count
+        return days
+
+
+    def stats(self):
+        return {
+            'days': len({day for day, _ in self.counts}),
+            'lastId': self.lastId,
+            'builds': self.builds,
+            'updates': self.updates,
+        }
@@ -0,0 +1,220 @@
+# Copyright 2016-2021 Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import concurrent.futures
+import time
+
+from aqt.qt import QTimer
+
+from . import util
+
+
+#
+# Steps
+#
+# The work of a job is a generator. Before each step it yields how many of how
+# many steps are done, and it returns the result of the job once it is over.
+# It can also yield a future, which is resolved on the main thread, to wait
+# for work that runs elsewhere without keeping the job queue busy.
+#
+
+def singleStep(function, params):
+    yield 0, 1
+    return function(**params)
+
+
+def chunkedSteps(function, params, key, chunkSize):
+    items = params[key]
+    results = []
+
+    for start in range(0, len(items), chunkSize):
+        yield start, len(items)
+        chunkParams = dict(params)
+        chunkParams[key] = items[start : start + chunkSize]
+        results.extend(function(**chunkParams))
+
+    return results
+
+
+def backgroundSteps(run, work):
+    # runs work through one of Anki's task manager functions, which runs it
+    # on a background thread and calls back on the main thread once it is done
+    future = concurrent.futures.Future()
+
+    def onDone(done):
+        try:
+            future.set_result(done.result())
+        except Exception as e:
+            future.set_exception(e)
+
+    yield 0, 1
+    run(work, onDone)
+    yield future
+    return future.result()
+
+
+def runSteps(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+#
+# Job
+#
+
+class Job:
+    def __init__(self, jobId, action, steps):
+        self.id = jobId
+        self.action = action
+        self.steps = steps
+        self.state = 'queued'
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.waiting = None
+        self.created = time.time()
+        self.finished = None
+
+
+    def step(self):
+        self.state = 'running'
+        try:
+            step = next(self.steps)
+            if isinstance(step, concurrent.futures.Future):
+                self.waiting = step
+            else:
+                self.done, self.total = step
+        except StopIteration as stop:
+            self.finish('done', result=stop.value)
+        except Exception as e:
+            self.finish('failed', error=str(e))
+
+
+    def cancel(self):
+        if not self.isFinished():
+            self.steps.close()
+            self.finish('cancelled')
+
+
+    def finish(self, state, result=None, error=None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        if state == 'done' and self.total is not None:
+            self.done = self.total
+
+
+    def isFinished(self):
+        return self.finished is not None
+
+
+    def status(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'status': self.state,
+            'progress': {'done': self.done, 'total': self.total},
+            'elapsed': (self.finished or time.time()) - self.created,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+#
+# JobQueue
+#
+
+class JobQueue:
+    def __init__(self, maxFinished=100):
+        self.jobs = {}
+        self.active = collections.deque()
+        self.finished = collections.deque()
+        self.maxFinished = maxFinished
+        self.nextId = 1
+        self.scheduled = False
+
+
+    def submit(self, action, steps):
+        job = Job(self.nextId, action, steps)
+        self.nextId += 1
+        self.jobs[job.id] = job
+        self.active.append(job)
+        self.schedule()
+        return job.id
+
+
+    def get(self, jobId):
+        job = self.jobs.get(jobId)
+        if job is None:
+            raise Exception('job was not found: {}'.format(jobId))
+        return job
+
+
+    def cancel(self, jobId):
+        job = self.get(jobId)
+        if job.isFinished():
+            return False
+        if job.waiting is not None:
+            raise Exception('job is waiting for Anki and cannot be cancelled: {}'.format(jobId))
+
+        job.cancel()
+        self.active.remove(job)
+        self.retire(job)
+        return True
+
+
+    def schedule(self):
+        if not self.scheduled and self.active:
+            self.scheduled = True
+            QTimer.singleShot(0, self.run)
+
+
+    def run(self):
+        # steps jobs round-robin for one time slice, then lets Anki process its events
+        self.scheduled = False
+        deadline = time.perf_counter() + util.setting('jobTimeSlice') / 1000
+
+        while self.active:
+            job = self.active.popleft()
+            job.step()
+            if job.isFinished():
+                self.retire(job)
+            elif job.waiting is not None:
+                job.waiting.add_done_callback(lambda future, job=job: self.resume(job))
+            else:
+                self.active.append(job)
+
+            if time.perf_counter() >= deadline:
+                break
+
+        self.schedule()
+
+
+    def resume(self, job):
+        job.waiting = None
+        self.active.append(job)
+        self.schedule()
+
+
+    def retire(self, job):
+        self.finished.append(job)
+        while len(self.finished) > self.maxFinished:
+            del self.jobs[self.finished.popleft().id]
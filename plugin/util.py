@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import base64
+import json
 import os
 import sys
 
@@ -51,6 +53,15 @@ def api(*versions):
     return decorator
 
 
+def queryChunks(values, size=500):
+    # sqlite limits the number of variables in a single statement, so queries
+    # over many ids are run on chunks of them. yields each chunk and its placeholders
+    values = list(values)
+    for start in range(0, len(values), size):
+        chunk = values[start : start + size]
+        yield chunk, ','.join('?' * len(chunk))
+
+
 def cardQuestion(card):
     if getattr(card, 'question', None) is None:
         return card._getQA()['q']
@@ -65,16 +76,47 @@ def cardAnswer(card):
     return card.answer()
 
 
+def encodeCursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+
+def decodeCursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise Exception('cursor is not valid: {}'.format(cursor))
+
+
+def withoutStyle(html, css):
+    # rendered questions and answers start with the css of their model
+    style = '<style>{}</style>'.format(css)
+    return html[len(style):] if html.startswith(style) else html
+
+
 DEFAULT_CONFIG = {
+    'apiEventDriven': True,
+    'apiIoThread': False,
     'apiKey': None,
     'apiLogPath': None,
     'apiPollInterval': 25,
     'apiVersion': 6,
-    'webBacklog': 5,
+    'jobChunkSize': 100,
+    'jobTimeSlice': 50,
+    'renderCachePersistent': False,
+    'renderCacheSize': 32,
+    'resultSetCacheSize': 32,
+    'resultSetCacheTtl': 300,
+    'webBacklog': 128,
     'webBindAddress': os.getenv('ANKICONNECT_BIND_ADDRESS', '127.0.0.1'),
     'webBindPort': 8765,
+    'webBodyTimeout': 60000,
     'webCorsOrigin': os.getenv('ANKICONNECT_CORS_ORIGIN', None),
     'webCorsOriginList': ['http://localhost'],
+    'webHeaderTimeout': 10000,
+    'webKeepAliveMaxRequests': 1000,
+    'webKeepAliveTimeout': 5000,
+    'webMaxBodySize': 256 * 1024 * 1024,
+    'webMaxRequestsPerCycle': 50,
     'ignoreOriginList': [],
     'webTimeout': 10000,
 }
@@ -13,22 +13,219 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import concurrent.futures
 import json
 import jsonschema
-import select
+import queue
+import selectors
 import socket
+import threading
+import time
+import traceback
+
+from aqt.qt import QObject, QSocketNotifier, QTimer, pyqtSignal
 
 from . import util
 
+
+if hasattr(QSocketNotifier, 'Type') and hasattr(QSocketNotifier.Type, 'Read'):
+    # Qt6
+    NotifierRead = QSocketNotifier.Type.Read
+    NotifierWrite = QSocketNotifier.Type.Write
+else:
+    # Qt5
+    NotifierRead = QSocketNotifier.Read
+    NotifierWrite = QSocketNotifier.Write
+
 #
 # WebRequest
 #
 
 class WebRequest:
-    def __init__(self, method, headers, body):
+    def __init__(self, method, headers, body, keepAlive=False):
         self.method = method
         self.headers = headers
         self.body = body
+        self.keepAlive = keepAlive
+
+
+#
+# WebRequestTooLarge
+#
+
+class WebRequestTooLarge(ValueError):
+    # The body of a request is larger than the server accepts. It is answered
+    # with a 413 and the connection is closed, without the body being received.
+    pass
+
+
+#
+# WebDeferredResponse
+#
+
+class WebDeferredResponse:
+    # A response to an action that is run on another thread;
+    # `encode` turns its reply into the response once it is done.
+    def __init__(self, future, encode):
+        self.future = future
+        self.encode = encode
+
+
+    def done(self):
+        return self.future.done()
+
+
+    def result(self):
+        return self.encode(self.future.result())
+
+
+#
+# WebRequestParser
+#
+
+class WebRequestParser:
+    # Parses requests incrementally as their bytes arrive. Headers are looked
+    # for only in the newly received data and parsed once, after which the
+    # body is received directly into a buffer preallocated from Content-Length.
+    # Whatever follows a request stays buffered for the next (pipelined) one.
+    # The parser remembers when the headers and the body of the current
+    # request started arriving, so that stalled requests can be expired.
+    minRecvSize = 4096
+    maxRecvSize = 1024 * 1024
+    maxHeaderSize = 64 * 1024
+
+    def __init__(self, maxBodySize):
+        self.recvSize = self.minRecvSize
+        self.maxBodySize = maxBodySize
+        self.reset()
+
+
+    def reset(self):
+        self.headerBuff = bytearray()
+        self.headerScanned = 0
+        self.request = None
+        self.body = None
+        self.bodyReceived = 0
+        self.headerStarted = None
+        self.bodyStarted = None
+
+
+    def isIdle(self):
+        return self.request is None and not self.headerBuff
+
+
+    def isExpired(self, headerTimeout, bodyTimeout):
+        now = time.monotonic()
+        if self.request is not None:
+            return now - self.bodyStarted > bodyTimeout
+        if self.headerStarted is not None:
+            return now - self.headerStarted > headerTimeout
+        return False
+
+
+    def recvFrom(self, sock):
+        # returns the number of bytes received, 0 if the peer closed the socket
+        if self.request is not None and self.bodyReceived < len(self.body):
+            remaining = len(self.body) - self.bodyReceived
+            size = min(remaining, self.recvSize)
+            length = sock.recv_into(memoryview(self.body)[self.bodyReceived:], size)
+            self.bodyReceived += length
+        else:
+            size = self.recvSize
+            chunk = sock.recv(size)
+            if chunk and self.headerStarted is None:
+                self.headerStarted = time.monotonic()
+            self.headerBuff += chunk
+            length = len(chunk)
+
+            # parse the headers as soon as they are in, so that the rest of
+            # the body is received directly into its own buffer
+            if self.request is None:
+                self.parseHeaders()
+
+        # grow the receive size while the socket keeps filling it up,
+        # shrink it back when it does not
+        if length == size:
+            self.recvSize = min(self.recvSize * 2, self.maxRecvSize)
+        elif length < size // 2:
+            self.recvSize = max(self.recvSize // 2, self.minRecvSize)
+
+        return length
+
+
+    def nextRequest(self):
+        # returns the next complete request, or None if it has not arrived yet
+        if self.request is None and not self.parseHeaders():
+            return None
+
+        if self.bodyReceived < len(self.body):
+            return None
+
+        request = self.request
+        request.body = self.body
+        self.request = None
+        self.body = None
+        self.bodyReceived = 0
+        self.bodyStarted = None
+        self.headerStarted = time.monotonic() if self.headerBuff else None
+        return request
+
+
+    def parseHeaders(self):
+        # the terminator might straddle the previously scanned data
+        end = self.headerBuff.find(b'\r\n\r\n', max(0, self.headerScanned - 3))
+        if end < 0:
+            self.headerScanned = len(self.headerBuff)
+            if self.headerScanned > self.maxHeaderSize:
+                raise ValueError('request headers are too large')
+            return False
+
+        lines = bytes(self.headerBuff[:end]).split(b'\r\n')
+        method = None
+        version = None
+
+        if len(lines) > 0:
+            request_line_parts = lines[0].split(b' ')
+            method = request_line_parts[0].upper() if len(request_line_parts) > 0 else None
+            version = request_line_parts[2].upper() if len(request_line_parts) > 2 else None
+
+        headers = {}
+        for line in lines[1:]:
+            pair = line.split(b': ')
+            headers[pair[0].lower()] = pair[1] if len(pair) > 1 else None
+
+        bodyLength = int(headers.get(b'content-length', 0))
+        if bodyLength < 0:
+            raise ValueError('invalid content length')
+        if bodyLength > self.maxBodySize:
+            raise WebRequestTooLarge('request body is too large')
+
+        headerLength = end + 4
+        buffered = min(len(self.headerBuff) - headerLength, bodyLength)
+
+        self.request = WebRequest(method, headers, None, self.isKeepAlive(version, headers))
+        self.body = bytearray(bodyLength)
+        self.body[:buffered] = memoryview(self.headerBuff)[headerLength : headerLength + buffered]
+        self.bodyReceived = buffered
+
+        del self.headerBuff[:headerLength + buffered]
+        self.headerScanned = 0
+        self.headerStarted = None
+        self.bodyStarted = time.monotonic()
+        return True
+
+
+    def isKeepAlive(self, version, headers):
+        # HTTP/1.1 connections are persistent unless the client asks otherwise,
+        # HTTP/1.0 ones only if the client explicitly asks for it
+        connection = headers.get(b'connection') or b''
+        tokens = [token.strip() for token in connection.lower().split(b',')]
+        if b'close' in tokens:
+            return False
+        if version == b'HTTP/1.1':
+            return True
+        return b'keep-alive' in tokens
 
 
 #
@@ -36,119 +233,517 @@ class WebRequest:
 #
 
 class WebClient:
-    def __init__(self, sock, handler):
+    # The socket is non-blocking: receive only reads what has already arrived,
+    # bounded by recvBudget bytes, and a partially received request stays in
+    # the parser until the next cycle. Complete requests are handled one at a
+    # time, so that the server can let clients take turns. Clients that take
+    # longer than the header or body deadline to send a request are dropped.
+    # Once the peer has closed its end, the requests it sent before are still
+    # answered, and the connection is closed after that.
+    recvBudget = 4 * 1024 * 1024
+    settingKeys = ('webBodyTimeout', 'webHeaderTimeout', 'webKeepAliveMaxRequests',
+                   'webKeepAliveTimeout', 'webMaxBodySize')
+    tooLargeResponse = b'HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+    def __init__(self, sock, handler, settings):
         self.sock = sock
         self.handler = handler
-        self.readBuff = bytes()
-        self.writeBuff = bytes()
+        self.parser = WebRequestParser(settings['webMaxBodySize'])
+        self.responses = collections.deque()
+        self.writeBuff = bytearray()
+        self.events = 0
+        self.requestCount = 0
+        self.closing = False
+        self.peerClosed = False
+        self.lastActivity = time.monotonic()
+        self.keepAliveTimeout = settings['webKeepAliveTimeout'] / 1000
+        self.keepAliveMaxRequests = settings['webKeepAliveMaxRequests']
+        self.headerTimeout = settings['webHeaderTimeout'] / 1000
+        self.bodyTimeout = settings['webBodyTimeout'] / 1000
+
+
+    def receive(self):
+        # reads until the socket has no more data or the budget is spent;
+        # returns False if the connection is gone
+        if self.closing or self.peerClosed:
+            return True
+
+        received = 0
+        while received < self.recvBudget:
+            try:
+                length = self.parser.recvFrom(self.sock)
+            except BlockingIOError:
+                return True
+            except WebRequestTooLarge:
+                self.rejectRequest(self.tooLargeResponse)
+                return True
+            except (OSError, ValueError, MemoryError):
+                return False
+            if not length:
+                self.peerClosed = True
+                return True
 
+            received += length
+            self.lastActivity = time.monotonic()
 
-    def advance(self, recvSize=1024):
-        if self.sock is None:
+        return True
+
+
+    def handleRequest(self):
+        # handles the next complete request, so that pipelined requests are
+        # answered in order; returns False if there was none
+        if self.closing:
             return False
 
-        rlist, wlist = select.select([self.sock], [self.sock], [], 0)[:2]
-        self.sock.settimeout(5.0)
+        try:
+            req = self.parser.nextRequest()
+        except WebRequestTooLarge:
+            self.rejectRequest(self.tooLargeResponse)
+            return False
 
-        if rlist:
-            while True:
-                try:
-                    msg = self.sock.recv(recvSize)
-                except (ConnectionResetError, socket.timeout):
-                    self.close()
-                    return False
-                if not msg:
-                    self.close()
-                    return False
-                self.readBuff += msg
-
-                req, length = self.parseRequest(self.readBuff)
-                if req is not None:
-                    self.readBuff = self.readBuff[length:]
-                    self.writeBuff += self.handler(req)
+        if req is None:
+            if self.peerClosed:
+                self.closing = True  # no more requests can arrive
+            return False
+
+        self.requestCount += 1
+        if self.requestCount >= self.keepAliveMaxRequests:
+            req.keepAlive = False
+        if not req.keepAlive:
+            self.closing = True
+            self.parser.reset()
+
+        response = self.handler(req)
+        if self.responses or isinstance(response, WebDeferredResponse):
+            self.responses.append(response)
+        else:
+            self.writeBuff += response
+
+        return True
+
+
+    def rejectRequest(self, response):
+        # answers after the responses to the earlier requests, and closes the
+        # connection once the answer is sent
+        self.closing = True
+        self.parser.reset()
+        if self.responses:
+            self.responses.append(response)
+        else:
+            self.writeBuff += response
+
+
+    def flushResponses(self):
+        # moves the responses that are ready to the write buffer, keeping
+        # them in the order in which their requests were received
+        while self.responses:
+            response = self.responses[0]
+            if isinstance(response, WebDeferredResponse):
+                if not response.done():
                     break
+                response = response.result()
 
+            self.writeBuff += response
+            self.responses.popleft()
 
 
-        if wlist and self.writeBuff:
-            try:
-                length = self.sock.send(self.writeBuff)
-                self.writeBuff = self.writeBuff[length:]
-                if not self.writeBuff:
-                    self.close()
-                    return False
-            except:
-                self.close()
-                return False
+    def send(self):
+        # returns False if the connection is gone
+        try:
+            self.flushResponses()
+        except Exception:
+            return False
+
+        if not self.writeBuff:
+            return True
+
+        try:
+            length = self.sock.send(self.writeBuff)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+        del self.writeBuff[:length]
+        self.lastActivity = time.monotonic()
         return True
 
 
+    def isFinished(self):
+        if self.sock is None:
+            return True
+
+        if not self.writeBuff and not self.responses:
+            if self.closing:
+                return True
+            if self.parser.isIdle() and time.monotonic() - self.lastActivity > self.keepAliveTimeout:
+                return True
+
+        return self.parser.isExpired(self.headerTimeout, self.bodyTimeout)
+
+
+    def wantsRead(self):
+        return not self.closing and not self.peerClosed
+
+
+    def wantsWrite(self):
+        return bool(self.writeBuff)
+
+
     def close(self):
         if self.sock is not None:
             self.sock.close()
             self.sock = None
 
-        self.readBuff = bytes()
-        self.writeBuff = bytes()
+        self.parser.reset()
+        self.responses.clear()
+        self.writeBuff = bytearray()
 
+#
+# WebNotifier
+#
 
-    def parseRequest(self, data):
-        parts = data.split('\r\n\r\n'.encode('utf-8'), 1)
-        if len(parts) == 1:
-            return None, 0
+class WebNotifier:
+    # Wakes the server up through Qt socket notifiers as soon as one of its
+    # sockets becomes ready, instead of polling all of them on a timer.
+    # Write notifiers are only enabled while a client has a pending response,
+    # and the housekeeping timer, which expires idle connections, only runs
+    # while there are clients connected.
+    def __init__(self, callback, housekeepingInterval=1000):
+        self.callback = callback
+        self.notifiers = {}
+        self.scheduled = False
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.callback)
+        self.timer.setInterval(housekeepingInterval)
 
-        lines = parts[0].split('\r\n'.encode('utf-8'))
-        method = None
 
-        if len(lines) > 0:
-            request_line_parts = lines[0].split(' '.encode('utf-8'))
-            method = request_line_parts[0].upper() if len(request_line_parts) > 0 else None
+    def watch(self, key, sock):
+        self.unwatch(key)
 
-        headers = {}
-        for line in lines[1:]:
-            pair = line.split(': '.encode('utf-8'))
-            headers[pair[0].lower()] = pair[1] if len(pair) > 1 else None
+        readNotifier = QSocketNotifier(sock.fileno(), NotifierRead)
+        readNotifier.activated.connect(self.onActivated)
+
+        writeNotifier = QSocketNotifier(sock.fileno(), NotifierWrite)
+        writeNotifier.setEnabled(False)
+        writeNotifier.activated.connect(self.onActivated)
+
+        self.notifiers[key] = (readNotifier, writeNotifier)
 
-        headerLength = len(parts[0]) + 4
-        bodyLength = int(headers.get('content-length'.encode('utf-8'), 0))
-        totalLength = headerLength + bodyLength
 
-        if totalLength > len(data):
-            return None, 0
+    def unwatch(self, key):
+        for notifier in self.notifiers.pop(key, ()):
+            notifier.setEnabled(False)
+            notifier.deleteLater()
 
-        body = data[headerLength : totalLength]
-        return WebRequest(method, headers, body), totalLength
+
+    def setInterest(self, key, read, write):
+        if key in self.notifiers:
+            for notifier, enabled in zip(self.notifiers[key], (read, write)):
+                if notifier.isEnabled() != enabled:
+                    notifier.setEnabled(enabled)
+
+
+    def schedule(self):
+        # runs the callback once more as soon as control returns to Qt,
+        # for work that was left over without any socket becoming ready
+        if not self.scheduled:
+            self.scheduled = True
+            QTimer.singleShot(0, self.onScheduled)
+
+
+    def setHousekeeping(self, enabled):
+        if self.timer.isActive() != enabled:
+            if enabled:
+                self.timer.start()
+            else:
+                self.timer.stop()
+
+
+    def onActivated(self, *args):
+        self.callback()
+
+
+    def onScheduled(self):
+        self.scheduled = False
+        self.callback()
+
+
+    def close(self):
+        self.timer.stop()
+        for key in list(self.notifiers):
+            self.unwatch(key)
+
+#
+# WebDispatcher
+#
+
+class WebDispatcher(QObject):
+    # Hands actions decoded on the I/O thread over to the main thread, which
+    # is the only one allowed to touch the collection. Each action is queued
+    # along with a future for its reply, and a signal, which is delivered on
+    # the main thread, tells it to run the next one.
+    dispatched = pyqtSignal()
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+        self.queue = queue.Queue()
+        self.dispatched.connect(self.onDispatched)
+
+
+    def __call__(self, params):
+        future = concurrent.futures.Future()
+        self.queue.put((params, future))
+        self.dispatched.emit()
+        return future
+
+
+    def onDispatched(self):
+        try:
+            params, future = self.queue.get_nowait()
+        except queue.Empty:
+            return
+
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(self.handler(params))
+            except BaseException as e:
+                future.set_exception(e)
 
 #
 # WebServer
 #
 
 class WebServer:
+    # Every cycle accepts all pending connections, polls all of the sockets
+    # with a single call, and then lets clients with complete requests take
+    # turns handling one request each, until none are left or the cycle has
+    # handled webMaxRequestsPerCycle of them. Clients that still have requests
+    # when the cycle ends go first in the next one.
+    #
+    # The server is either advanced on the main thread, or, once started, by
+    # its own I/O thread. In the latter case the handler is a WebDispatcher,
+    # and the thread is woken up through a socket pair whenever a reply is
+    # ready to be sent.
+    #
+    # An unexpected error while serving a client is printed, and only that
+    # client is dropped. The I/O thread keeps running whatever goes wrong.
     def __init__(self, handler):
         self.handler = handler
         self.clients = []
+        self.backlog = []
         self.sock = None
+        self.selector = None
+        self.notifier = None
+        self.thread = None
+        self.stopping = False
+        self.wakeupSocks = None
 
 
-    def advance(self):
-        if self.sock is not None:
-            self.acceptClients()
-            self.advanceClients()
+    def setNotifier(self, notifier):
+        if self.notifier is not None:
+            self.notifier.close()
 
+        self.notifier = notifier
+        if notifier is not None:
+            if self.sock is not None:
+                notifier.watch(self, self.sock)
+            for client in self.clients:
+                notifier.watch(client, client.sock)
+                notifier.setInterest(client, client.wantsRead(), client.wantsWrite())
 
-    def acceptClients(self):
-        rlist = select.select([self.sock], [], [], 0)[0]
-        if not rlist:
+
+    def start(self):
+        self.stopping = False
+        self.wakeupSocks = socket.socketpair()
+        for sock in self.wakeupSocks:
+            sock.setblocking(False)
+        self.selector.register(self.wakeupSocks[0], selectors.EVENT_READ, None)
+
+        self.thread = threading.Thread(target=self.run, name='AnkiConnect', daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+        while not self.stopping:
+            try:
+                self.advance(0 if self.backlog else 1.0)
+            except Exception:
+                traceback.print_exc()
+                time.sleep(0.1)  # in case the error keeps recurring
+
+
+    def wakeup(self):
+        wakeupSocks = self.wakeupSocks
+        if wakeupSocks is None:
             return
 
-        clientSock = self.sock.accept()[0]
-        if clientSock is not None:
+        try:
+            wakeupSocks[1].send(b'\0')
+        except OSError:
+            pass  # either the buffer is full, so a wakeup is pending anyway, or the server is stopped
+
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping = True
+            self.wakeup()
+            self.thread.join()
+            self.thread = None
+
+        if self.wakeupSocks is not None:
+            for sock in self.wakeupSocks:
+                sock.close()
+            self.wakeupSocks = None
+
+
+    def advance(self, timeout=0):
+        if self.sock is None:
+            return
+
+        ready = []
+        for key, events in self.selector.select(timeout):
+            if key.fileobj is self.sock:
+                ready.extend(self.acceptClients())
+            elif key.data is None:
+                self.drainWakeups()
+            elif events & selectors.EVENT_READ:
+                ready.append(key.data)
+
+        for client in ready:
+            if client.sock is not None and not self.serveClient(client.receive):
+                self.dropClient(client)
+
+        self.handleRequests(ready)
+        self.advanceClients()
+
+        if self.backlog and self.notifier is not None:
+            self.notifier.schedule()
+
+
+    def acceptClients(self):
+        # accepts every pending connection; they are likely to have already
+        # sent their request, so they are returned to be read from right away
+        clients = []
+        while True:
+            try:
+                clientSock = self.sock.accept()[0]
+            except OSError:
+                break
+
             clientSock.setblocking(False)
-            self.clients.append(WebClient(clientSock, self.handlerWrapper))
+            try:
+                client = WebClient(clientSock, self.handlerWrapper, self.clientSettings)
+            except Exception:
+                traceback.print_exc()
+                clientSock.close()
+                continue
+
+            client.events = selectors.EVENT_READ
+            self.selector.register(clientSock, client.events, client)
+            if self.notifier is not None:
+                self.notifier.watch(client, clientSock)
+
+            self.clients.append(client)
+            clients.append(client)
+
+        return clients
+
+
+    def drainWakeups(self):
+        try:
+            while self.wakeupSocks[0].recv(4096):
+                pass
+        except OSError:
+            pass
+
+
+    def handleRequests(self, clients):
+        pending = collections.deque(self.backlog)
+        pending.extend(client for client in clients if client not in self.backlog)
+
+        budget = self.maxRequestsPerCycle
+        while pending and budget > 0:
+            served = []
+            while pending and budget > 0:
+                client = pending.popleft()
+                if client.sock is None:
+                    continue
+
+                try:
+                    handled = client.handleRequest()
+                except (ValueError, MemoryError):
+                    self.dropClient(client)
+                    continue
+                except Exception:
+                    traceback.print_exc()
+                    self.dropClient(client)
+                    continue
+
+                if handled:
+                    served.append(client)
+                    budget -= 1
+
+            # clients that did not get a turn in this round go first
+            pending.extend(served)
+
+        self.backlog = list(pending)
 
 
     def advanceClients(self):
-        self.clients = list(filter(lambda c: c.advance(), self.clients))
+        clients = []
+        for client in self.clients:
+            if self.serveClient(self.advanceClient, client):
+                clients.append(client)
+            else:
+                self.dropClient(client)
+
+        self.clients = clients
+
+        if self.notifier is not None:
+            self.notifier.setHousekeeping(bool(self.clients))
+
+
+    def advanceClient(self, client):
+        # returns False if the client is done with
+        if client.sock is not None and not client.send():
+            return False
+        if client.isFinished():
+            return False
+
+        self.updateInterest(client)
+        return True
+
+
+    def serveClient(self, step, *args):
+        # runs a step for a client; an unexpected error only drops that client
+        try:
+            return step(*args)
+        except Exception:
+            traceback.print_exc()
+            return False
+
+
+    def updateInterest(self, client):
+        read = client.wantsRead()
+        write = client.wantsWrite()
+
+        events = (selectors.EVENT_READ if read else 0) | (selectors.EVENT_WRITE if write else 0)
+        if events != client.events:
+            client.events = events
+            self.selector.modify(client.sock, events, client)
+            if self.notifier is not None:
+                self.notifier.setInterest(client, read, write)
+
+
+    def dropClient(self, client):
+        if client.sock is not None:
+            self.selector.unregister(client.sock)
+        if self.notifier is not None:
+            self.notifier.unwatch(client)
+
+        client.close()
 
 
     def listen(self):
@@ -160,8 +755,37 @@ class WebServer:
         self.sock.bind((util.setting('webBindAddress'), util.setting('webBindPort')))
         self.sock.listen(util.setting('webBacklog'))
 
+        self.maxRequestsPerCycle = util.setting('webMaxRequestsPerCycle')
+        # reading settings goes to disk, so clients share the ones read here
+        self.clientSettings = {key: util.setting(key) for key in WebClient.settingKeys}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
+
+        if self.notifier is not None:
+            self.notifier.watch(self, self.sock)
+
 
     def handlerWrapper(self, req):
+        response = self.handleRequest(req)
+        if isinstance(response, WebDeferredResponse):
+            encode = response.encode
+            response.encode = lambda reply: self.finishResponse(req, *encode(reply))
+            return response
+
+        return self.finishResponse(req, *response)
+
+
+    def finishResponse(self, req, headers, body):
+        headers.append(['Connection', 'keep-alive' if req.keepAlive else 'close'])
+        return self.buildResponse(headers, body)
+
+
+    def encodeReply(self, corsOrigin, reply):
+        body = json.dumps(reply).encode('utf-8')
+        return self.buildHeaders(corsOrigin, body), body
+
+
+    def handleRequest(self, req):
         allowed, corsOrigin = self.allowOrigin(req)
 
         if req.method == b'OPTIONS':
@@ -174,11 +798,11 @@ class WebServer:
                 # then browsers won't fail requests due to the private network access check
                 headers.append(['Access-Control-Allow-Private-Network', 'true'])
 
-            return self.buildResponse(headers, body)
+            return headers, body
     
         try:
             params = json.loads(req.body.decode('utf-8'))
-            jsonschema.validate(params, request_schema)
+            request_validator.validate(params)
         except (ValueError, jsonschema.ValidationError) as e:
             if allowed:
                 if len(req.body) == 0:
@@ -187,7 +811,7 @@ class WebServer:
                     reply = format_exception_reply(util.setting('apiVersion'), e)
                     body = json.dumps(reply).encode('utf-8')
                 headers = self.buildHeaders(corsOrigin, body)
-                return self.buildResponse(headers, body)
+                return headers, body
             else:
                 params = {}  # trigger the 403 response below
 
@@ -199,17 +823,22 @@ class WebServer:
                 if not allowed :
                     corsOrigin = params['params']['origin']
                         
-            body = json.dumps(self.handler(params)).encode('utf-8')
-            headers = self.buildHeaders(corsOrigin, body)
+            reply = self.handler(params)
+            if isinstance(reply, concurrent.futures.Future):
+                reply.add_done_callback(lambda future: self.wakeup())
+                return WebDeferredResponse(reply, lambda reply: self.encodeReply(corsOrigin, reply))
+
+            headers, body = self.encodeReply(corsOrigin, reply)
         else :
             headers = [
                 ['HTTP/1.1 403 Forbidden', None],
                 ['Access-Control-Allow-Origin', corsOrigin],
-                ['Access-Control-Allow-Headers', '*']
+                ['Access-Control-Allow-Headers', '*'],
+                ['Content-Length', '0']
             ]
             body = ''.encode('utf-8')
 
-        return self.buildResponse(headers, body)
+        return headers, body
 
 
     def allowOrigin(self, req):
@@ -256,7 +885,7 @@ class WebServer:
 
 
     def buildResponse(self, headers, body):
-        resp = bytes()
+        resp = bytearray()
         for key, value in headers:
             if value is None:
                 resp += '{}\r\n'.format(key).encode('utf-8')
@@ -269,14 +898,24 @@ class WebServer:
 
 
     def close(self):
-        if self.sock is not None:
-            self.sock.close()
-            self.sock = None
+        self.stop()
+
+        if self.notifier is not None:
+            self.notifier.close()
 
         for client in self.clients:
             client.close()
 
         self.clients = []
+        self.backlog = []
+
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
 
 
 def format_success_reply(api_version, result):
@@ -296,6 +935,11 @@ request_schema = {
         "action": {"type": "string", "minLength": 1},
         "version": {"type": "integer"},
         "params": {"type": "object"},
+        "async": {"type": "boolean"},
     },
     "required": ["action"],
 }
+
+# checking the schema itself is much slower than validating a request against it,
+# so it is only done once
+request_validator = jsonschema.validators.validator_for(request_schema)(request_schema)
@@ -113,11 +113,11 @@ def profile_created_and_loaded(session):
 
 
 @contextmanager
-def anki_connect_config_loaded(session, web_bind_port):
+def anki_connect_config_loaded(session, web_bind_port, **config):
     with session.addon_config_created(
         package_name="plugin",
         default_config=DEFAULT_CONFIG,
-        user_config={**DEFAULT_CONFIG, "webBindPort": web_bind_port}
+        user_config={**DEFAULT_CONFIG, "webBindPort": web_bind_port, **config}
     ):
         yield
 
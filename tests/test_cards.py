@@ -9,11 +9,44 @@ def test_findCards(setup):
     assert len(card_ids) == 4
 
 
+class TestFindCardsPages:
+    def test_pages_cover_all_cards(self, setup):
+        page = ac.findCards(query="deck:test_deck", limit=3, order="c.id")
+        assert page["total"] == 4
+        assert len(page["cards"]) == 3
+        rest = ac.findCards(cursor=page["cursor"])
+        assert rest["cursor"] is None
+        assert page["cards"] + rest["cards"] == sorted(setup.card_ids)
+
+    def test_cardsInfo_with_query(self, setup):
+        page = ac.cardsInfo(query="deck:test_deck", limit=2, order="c.id desc",
+                            attributes=["deckName"])
+        assert [card["cardId"] for card in page["cards"]] == sorted(setup.card_ids, reverse=True)[:2]
+        assert page["total"] == 4
+        rest = ac.cardsInfo(cursor=page["cursor"], attributes=["deckName"])
+        assert len(rest["cards"]) == 2
+        assert rest["cursor"] is None
+
+    def test_cursor_expires_with_its_result_set(self, setup):
+        page = ac.findCards(query="deck:test_deck", limit=3, order="c.id")
+        ac.resultSets.invalidate()
+        with pytest.raises(Exception, match="cursor has expired"):
+            ac.findCards(cursor=page["cursor"])
+
+    def test_invalid_cursor(self, setup):
+        with pytest.raises(Exception, match="cursor is not valid"):
+            ac.findCards(cursor="invalid")
+
+
 class TestEaseFactors:
     def test_setEaseFactors(self, setup):
         result = ac.setEaseFactors(cards=setup.card_ids, easeFactors=[4200] * 4)
         assert result == [True] * 4
 
+    def test_setEaseFactors_can_be_undone(self, setup):
+        ac.setEaseFactors(cards=setup.card_ids, easeFactors=[4200] * 4)
+        assert ac.collection().undo_status().undo
+
     def test_setEaseFactors_with_invalid_card_id(self, setup):
         result = ac.setEaseFactors(cards=[123], easeFactors=[4200])
         assert result == [False]
@@ -44,6 +77,36 @@ class TestSuspending:
         result = ac.areSuspended(cards=setup.card_ids)
         assert result == [True] * 4
 
+    def test_suspend_skips_suspended_cards_without_changing_argument(self, setup):
+        ac.suspend(cards=setup.note1_card_ids)
+        cards = list(setup.card_ids)
+        assert ac.suspend(cards=cards) is True
+        assert cards == setup.card_ids
+        assert ac.areSuspended(cards=cards) == [True] * 4
+        assert ac.suspend(cards=cards) is False
+
+
+def test_setSpecificValueOfCard(setup):
+    card_id = setup.card_ids[0]
+    assert ac.setSpecificValueOfCard(card=card_id, keys=["flags", "factor"], newValues=[2, 1300]) == [True]
+    assert ac.getEaseFactors(cards=[card_id]) == [1300]
+    assert ac.setSpecificValueOfCard(card=card_id, keys=["flags"], newValues=["red"])[0][0] is False
+    assert ac.setSpecificValueOfCard(card=123, keys=["flags"], newValues=[1])[0][0] is False
+
+
+def test_setSpecificValueOfCard_with_keys_left_to_anki(setup):
+    card_id = setup.card_ids[0]
+    assert ac.setSpecificValueOfCard(card=card_id, keys=["data"], newValues=[""]) == [True]
+
+    result = ac.setSpecificValueOfCard(card=card_id, keys=["did"], newValues=[123], warning_check=True)
+    assert result == [[False, "deck was not found: 123"]]
+    result = ac.setSpecificValueOfCard(card=card_id, keys=["nid"], newValues=[123], warning_check=True)
+    assert result == [[False, "note was not found: 123"]]
+
+    result = ac.setSpecificValueOfCard(card=card_id, keys=["mod"], newValues=[1], warning_check=True)
+    assert result[0][0] is False
+    assert ac.cardsModTime(cards=[card_id])[0]["mod"] != 1
+
 
 def test_areDue_returns_True_for_new_cards(setup):
     result = ac.areDue(cards=setup.card_ids)
@@ -55,11 +118,46 @@ def test_getIntervals(setup):
     ac.getIntervals(cards=setup.card_ids, complete=True)
 
 
+def test_areDue_and_getIntervals_of_reviewed_card(setup):
+    card_id = setup.card_ids[0]
+    ac.setSpecificValueOfCard(card=card_id, keys=["type", "queue", "due"],
+                              newValues=[2, 2, 0], warning_check=True)
+    ac.insertReviews(reviews=[
+        (456, card_id, -1, 3, -600, -60, 2500, 6157, 0),
+        (789, card_id, -1, 3, 4, -600, 2500, 4846, 1),
+    ])
+
+    assert ac.getIntervals(cards=setup.card_ids) == [4, 0, 0, 0]
+    assert ac.getIntervals(cards=setup.card_ids[:2], complete=True) == [[-600, 4], 0]
+    assert ac.areDue(cards=setup.card_ids) == [True] * 4
+
+
 def test_cardsToNotes(setup):
     result = ac.cardsToNotes(cards=setup.card_ids)
     assert {*result} == {setup.note1_id, setup.note2_id}
 
 
+class TestSearchFacets:
+    def test_counts_by_facet(self, setup):
+        ac.suspend(cards=setup.note1_card_ids)
+        result = ac.searchFacets(query="deck:test_deck")
+        assert result == {
+            "total": 4,
+            "decks": {"test_deck": 4},
+            "models": {"test_model": 4},
+            "tags": {"tag1": 2, "tag2": 2},
+            "queues": {-1: 2, 0: 2},
+            "types": {0: 4},
+        }
+
+    def test_count_only(self, setup):
+        assert ac.searchFacets(query="tag:tag1", countOnly=True) == {"total": 2}
+
+    def test_selected_facets(self, setup):
+        result = ac.searchFacets(query="deck:test_deck", facets=["tags"])
+        assert result == {"total": 4, "tags": {"tag1": 2, "tag2": 2}}
+
+
 class TestCardInfo:
     def test_with_valid_ids(self, setup):
         result = ac.cardsInfo(cards=setup.card_ids)
@@ -69,6 +167,71 @@ class TestCardInfo:
         result = ac.cardsInfo(cards=[123])
         assert result == [{}]
 
+    def test_with_projection(self, setup):
+        result = ac.cardsInfo(cards=setup.note1_card_ids[:1] + [123],
+                              fields=["field2"],
+                              attributes=["fields", "due", "interval"])
+        assert result == [{
+            "cardId": setup.note1_card_ids[0],
+            "fields": {"field2": {"value": "note1 field2", "order": 1}},
+            "interval": 0,
+            "due": result[0]["due"],
+        }, {}]
+
+    def test_note_with_fields_not_matching_its_model(self, setup):
+        ac.collection().db.execute("update notes set flds = ? where id = ?",
+                                   "only field1", setup.note1_id)
+        result = ac.cardsInfo(cards=setup.note1_card_ids[:1], attributes=["fields"])
+        assert result[0]["fields"]["field1"]["value"] == "only field1"
+        assert result[0]["fields"]["field2"]["value"] == ""
+
+    def test_normalized(self, setup):
+        result = ac.cardsInfo(cards=setup.card_ids + [123], normalized=True)
+        plain = ac.cardsInfo(cards=setup.card_ids + [123])
+        assert result["cards"][-1] == {}
+        for card, expected in zip(result["cards"][:-1], plain):
+            model = result["models"][card.pop("modelId")]
+            deck_name = result["decks"][card.pop("deckId")]
+            style = "<style>{}</style>".format(model["css"])
+            assert {**card, "modelName": model["name"], "css": model["css"],
+                    "deckName": deck_name, "question": style + card["question"],
+                    "answer": style + card["answer"]} == expected
+
+    def test_renders_are_cached(self, setup):
+        card_id = setup.note1_card_ids[0]
+        first = ac.cardsInfo(cards=[card_id], attributes=["question", "answer"])
+        hits = ac.getCacheStats()["render"]["hits"]
+        second = ac.cardsInfo(cards=[card_id], attributes=["question", "answer"])
+        assert second == first
+        assert ac.getCacheStats()["render"]["hits"] == hits + 1
+
+    def test_editing_note_invalidates_render(self, setup):
+        card_id = setup.note1_card_ids[0]
+        ac.cardsInfo(cards=[card_id], attributes=["question"])
+        ac.updateNoteFields(note={"id": setup.note1_id, "fields": {"field1": "edited"}})
+        result = ac.cardsInfo(cards=[card_id], attributes=["question"])
+        assert "edited" in result[0]["question"]
+
+    def test_renaming_deck_and_flagging_card_invalidate_render(self, setup):
+        ac.updateModelTemplates(model={"name": "test_model", "templates": {
+            "Card 1": {"Front": "{{field1}} {{Deck}} {{CardFlag}}"}}})
+        card_id = setup.note1_card_ids[0]
+        ac.cardsInfo(cards=[card_id], attributes=["question"])
+
+        decks = ac.collection().decks
+        decks.rename(decks.byName("test_deck"), "renamed_deck")
+        ac.setSpecificValueOfCard(card=card_id, keys=["flags"], newValues=[1])
+        result = ac.cardsInfo(cards=[card_id], attributes=["question"])
+        assert "renamed_deck" in result[0]["question"]
+        assert "flag1" in result[0]["question"]
+
+
+def test_cardsModTime(setup):
+    result = ac.cardsModTime(cards=[setup.card_ids[0], 123])
+    assert result[0]["cardId"] == setup.card_ids[0]
+    assert result[0]["mod"] > 0
+    assert result[1] == {}
+
 
 def test_forgetCards(setup):
     ac.forgetCards(cards=setup.card_ids)
@@ -23,6 +23,12 @@ def test_changeDeck(setup):
     assert "bar" in ac.deckNames()
 
 
+def test_getDecks(setup):
+    ac.changeDeck(cards=setup.note1_card_ids, deck="bar")
+    result = ac.getDecks(cards=setup.card_ids)
+    assert result == {"bar": setup.note1_card_ids, "test_deck": setup.note2_card_ids}
+
+
 def test_deleteDeck(setup):
     before = ac.deckNames()
     ac.deleteDecks(decks=["test_deck"], cardsToo=True)
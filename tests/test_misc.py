@@ -5,7 +5,7 @@ import pytest
 
 from conftest import ac, anki_connect_config_loaded, \
     set_up_test_deck_and_test_model_and_two_notes, \
-    current_decks_and_models_etc_preserved, wait
+    current_decks_and_models_etc_preserved, wait, wait_until
 
 
 # version is retrieved from config
@@ -32,6 +32,118 @@ def test_apiReflect(setup):
     }
 
 
+def test_apiReflect_lists_all_actions(setup):
+    result = ac.apiReflect(scopes=["actions"])
+    assert "apiReflect" in result["actions"]
+    assert "collection" not in result["actions"]
+    assert result["actions"] == sorted(result["actions"])
+
+
+def test_handler_dispatches_actions(setup):
+    assert ac.handler({"action": "version", "version": 6}) == \
+        {"result": 6, "error": None}
+    assert ac.handler({"action": "invalidMethod", "version": 6}) == \
+        {"result": None, "error": "unsupported action"}
+    assert ac.handler({"action": "version"}) == 6
+
+
+class TestMulti:
+    @staticmethod
+    def add_note_action(front):
+        return {"action": "addNote", "version": 6, "params": {"note": {
+            "deckName": "test_deck",
+            "modelName": "Basic",
+            "fields": {"Front": front, "Back": "back"},
+        }}}
+
+    def test_multi_in_transaction(self, setup):
+        result = ac.multi(transaction=True, actions=[
+            self.add_note_action("foo"),
+            self.add_note_action("foo"),
+            self.add_note_action("bar"),
+        ])
+
+        assert isinstance(result[0]["result"], int)
+        assert "duplicate" in result[1]["error"]
+        assert isinstance(result[2]["result"], int)
+        assert len(ac.findNotes(query="deck:test_deck Back:back")) == 2
+
+    def test_atomic_multi_rolls_back_on_error(self, setup):
+        with pytest.raises(Exception, match="action 2 failed: unsupported"):
+            ac.multi(atomic=True, actions=[
+                {"action": "createDeck", "params": {"deck": "rolled_back"}},
+                self.add_note_action("foo"),
+                {"action": "invalidMethod"},
+            ])
+
+        assert "rolled_back" not in ac.deckNames()
+        assert ac.findNotes(query="deck:test_deck Back:back") == []
+        # the rollback clears the whole undo history
+        assert not ac.collection().undo_status().undo
+
+    def test_multi_with_references_to_earlier_results(self, setup):
+        result = ac.multi(actions=[
+            {"action": "findNotes", "params": {"query": "deck:test_deck"}},
+            {"action": "notesInfo",
+             "params": {"notes": {"$result": 0}},
+             "return": False},
+            {"action": "cardsInfo",
+             "params": {"cards": {"$result": 1, "key": "cards", "flatten": True}}},
+            {"action": "findCards", "params": {"query": {"$result": 3}}},
+        ])
+
+        assert result[1] is None
+        assert sorted(card["cardId"] for card in result[2]) == sorted(setup.card_ids)
+        assert result[3] == {
+            "result": None,
+            "error": "reference to action 3 which has not run yet"
+        }
+
+
+class TestJobs:
+    @staticmethod
+    def wait_for_job(job):
+        wait_until(lambda: ac.jobStatus(job)["status"] not in ("queued", "running"))
+        return ac.jobStatus(job)
+
+    def test_async_action_runs_as_job(self, setup):
+        job = ac.handler({"action": "findCards", "version": 6, "async": True,
+                          "params": {"query": "deck:test_deck"}})["result"]
+        status = self.wait_for_job(job)
+
+        assert status["status"] == "done"
+        assert status["progress"] == {"done": 1, "total": 1}
+        assert sorted(status["result"]) == sorted(setup.card_ids)
+
+    def test_async_notesInfo_runs_in_chunks(self, setup):
+        job = ac.handler({"action": "notesInfo", "version": 6, "async": True,
+                          "params": {"notes": [setup.note1_id, setup.note2_id]}})["result"]
+        status = self.wait_for_job(job)
+
+        assert status["status"] == "done"
+        assert [note["noteId"] for note in status["result"]] == \
+            [setup.note1_id, setup.note2_id]
+
+    def test_async_replaceTagsInAllNotes_runs_in_chunks(self, setup):
+        job = ac.handler({"action": "replaceTagsInAllNotes", "version": 6, "async": True,
+                          "params": {"tag_to_replace": "tag1", "replace_with_tag": "foo"}})["result"]
+        status = self.wait_for_job(job)
+
+        assert status["status"] == "done"
+        assert status["progress"]["total"] >= 2
+        assert ac.getNoteTags(note=setup.note1_id) == ["foo"]
+
+    def test_jobCancel(self, setup):
+        job = ac.handler({"action": "deckNames", "version": 6, "async": True})["result"]
+        assert ac.jobCancel(job=job) is True
+        assert ac.jobStatus(job=job)["status"] == "cancelled"
+        assert ac.jobCancel(job=job) is False
+
+    def test_jobStatus_of_unknown_job(self, setup):
+        with pytest.raises(Exception, match="job was not found"):
+            ac.jobStatus(job=-1)
+
+
 class TestProfiles:
     def test_getProfiles(self, session_with_profile_loaded):
         result = ac.getProfiles()
@@ -75,3 +187,18 @@ class TestExportImport:
             assert "test_deck" not in ac.deckNames()
             ac.importPackage(path=filename)
             assert "test_deck" in ac.deckNames()
+
+    def test_async_export_and_import_run_in_background(self, session_with_profile_loaded):
+        filename = session_with_profile_loaded.base + "/export_async.apkg"
+
+        with current_decks_and_models_etc_preserved():
+            set_up_test_deck_and_test_model_and_two_notes()
+            job = ac.handler({"action": "exportPackage", "version": 6, "async": True,
+                              "params": {"deck": "test_deck", "path": filename}})["result"]
+            assert TestJobs.wait_for_job(job)["result"] is True
+
+        with current_decks_and_models_etc_preserved():
+            job = ac.handler({"action": "importPackage", "version": 6, "async": True,
+                              "params": {"path": filename}})["result"]
+            assert TestJobs.wait_for_job(job)["result"] is True
+            assert "test_deck" in ac.deckNames()
@@ -47,6 +47,20 @@ class TestNoteAddition:
         assert isinstance(result[1], int)
         assert result[2] is None
 
+    def test_addNotes_finds_duplicates_in_collection_and_batch(self, setup):
+        ac.addNote(make_note(front="<b>foo</b>"))
+        result = ac.addNotes(notes=[
+            make_note(front="foo"),
+            make_note(front="bar"),
+            make_note(front="<i>bar</i>"),
+            make_note(front=""),
+            {**make_note(front="foo"), "deckName": "no such deck"},
+        ])
+
+        assert result[0] is None
+        assert isinstance(result[1], int)
+        assert result[2:] == [None, None, None]
+
     def test_bug164(self, setup):
         note = {
             "deckName": "test_deck",
@@ -68,6 +82,65 @@ def test_notesInfo(setup):
     assert result[0]["fields"]["field1"]["value"] == "note1 field1"
 
 
+def test_notesInfo_keeps_order_and_marks_missing_notes(setup):
+    result = ac.notesInfo(notes=[setup.note2_id, 123, setup.note1_id, setup.note2_id])
+    assert [note.get("noteId") for note in result] == \
+        [setup.note2_id, None, setup.note1_id, setup.note2_id]
+    assert result[1] == {}
+    assert result[0]["cards"] == setup.note2_card_ids
+    assert result[0]["modelName"] == "test_model"
+    assert result[0]["fields"]["field2"] == {"value": "note2 field2", "order": 1}
+
+
+def test_notesInfo_with_projection(setup):
+    result = ac.notesInfo(notes=[setup.note1_id],
+                          fields=["field1"],
+                          attributes=["fields", "tags"])
+    assert result == [{
+        "noteId": setup.note1_id,
+        "tags": ["tag1"],
+        "fields": {"field1": {"value": "note1 field1", "order": 0}},
+    }]
+
+
+def test_notesInfo_of_note_with_fields_not_matching_its_model(setup):
+    ac.collection().db.execute("update notes set flds = ? where id = ?",
+                               "only field1", setup.note1_id)
+    result = ac.notesInfo(notes=[setup.note1_id], attributes=["fields"])
+    assert result[0]["fields"] == {"field1": {"value": "only field1", "order": 0},
+                                   "field2": {"value": "", "order": 1}}
+
+
+def test_notesInfo_normalized(setup):
+    result = ac.notesInfo(notes=[setup.note1_id, setup.note2_id], normalized=True)
+    model_id = result["notes"][0]["modelId"]
+    assert result["models"] == {model_id: {"name": "test_model"}}
+    assert result["notes"][1]["modelId"] == model_id
+    assert "modelName" not in result["notes"][0]
+
+
+def test_notesInfo_with_query(setup):
+    page = ac.notesInfo(query="deck:test_deck", limit=1, order="n.id", attributes=["tags"])
+    assert page == {"notes": [{"noteId": setup.note1_id, "tags": ["tag1"]}],
+                    "cursor": page["cursor"], "total": 2}
+    rest = ac.findNotes(cursor=page["cursor"])
+    assert rest == {"notes": [setup.note2_id], "cursor": None, "total": 2}
+
+
+def test_findNotes_is_cached_until_collection_changes(setup):
+    first = ac.findNotes(query="deck:test_deck")
+    hits = ac.getCacheStats()["resultSets"]["hits"]
+    assert ac.findNotes(query="deck:test_deck") == first
+    assert ac.getCacheStats()["resultSets"]["hits"] == hits + 1
+
+    ac.addNote({
+        "deckName": "test_deck",
+        "modelName": "Basic",
+        "fields": {"Front": "front3", "Back": "back3"},
+    })
+    assert len(ac.findNotes(query="deck:test_deck")) == 3
+
+
 class TestTags:
     def test_addTags(self, setup):
         ac.addTags(notes=[setup.note1_id], tags="tag2")
@@ -151,6 +224,28 @@ class TestCanAddNotes:
         result = ac.canAddNotes(notes=notes)
         assert result == [False, True, True]
 
+    def test_canAddNotes_respects_duplicate_scope(self, setup):
+        ac.createDeck("test_deck::child")
+        ac.addNote({**make_note(front="foo"), "deckName": "test_deck::child"})
+
+        def in_deck_scope(**scope_options):
+            return {**make_note(front="foo"), "options": {
+                "duplicateScope": "deck",
+                "duplicateScopeOptions": scope_options,
+            }}
+
+        result = ac.canAddNotes(notes=[
+            make_note(front="foo"),
+            in_deck_scope(),
+            in_deck_scope(checkChildren=True),
+            in_deck_scope(deckName="test_deck::child"),
+            in_deck_scope(deckName="no such deck"),
+            {**make_note(front="foo"), "modelName": "Basic (and reversed card)"},
+            {**in_deck_scope(checkChildren=True, checkAllModels=True),
+             "modelName": "Basic (and reversed card)"},
+        ])
+        assert result == [False, True, False, False, True, True, False]
+
 
 def test_findNotes(setup):
     result = ac.findNotes(query="deck:test_deck")
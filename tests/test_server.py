@@ -1,5 +1,7 @@
+import http.client
 import json
 import multiprocessing
+import socket
 import time
 import urllib.error
 import urllib.request
@@ -71,20 +73,20 @@ class Client:
 
 
 # spawning requires a top-level function for pickling
-def external_anki_entry_function(web_bind_port, exit_event):
+def external_anki_entry_function(web_bind_port, exit_event, config):
     with empty_anki_session_started() as session:
-        with anki_connect_config_loaded(session, web_bind_port):
+        with anki_connect_config_loaded(session, web_bind_port, **config):
             with anki_connect_web_server_started():
                 with profile_created_and_loaded(session):
                     wait_until(exit_event.is_set)
 
 
 @contextmanager
-def external_anki_running(process_run_method):
+def external_anki_running(process_run_method, **config):
     context = multiprocessing.get_context(process_run_method)
     exit_event = context.Event()
     web_bind_port = find_free_port()
-    function = partial(external_anki_entry_function, web_bind_port, exit_event)
+    function = partial(external_anki_entry_function, web_bind_port, exit_event, config)
 
     with function_running_in_a_process(context, function) as process:
         client = Client(port=web_bind_port)
@@ -118,6 +120,18 @@ def external_anki(request):
         yield client
 
 
+@pytest.fixture(scope="module")
+def external_anki_with_io_thread(request):
+    """
+    Same as `external_anki`, with the web server running on its own I/O thread.
+    """
+    with external_anki_running(
+        "fork" if request.config.option.forked else "spawn",
+        apiIoThread=True
+    ) as client:
+        yield client
+
+
 ##############################################################################
 
 
@@ -194,3 +208,108 @@ def test_403_in_case_of_disallowed_origin(external_anki):
 
     with pytest.raises(urllib.error.HTTPError, match="403"):  # bad json
         external_anki.send_bytes(b'{1: 2}', headers={b"origin": b"foo"})
+
+
+def test_keep_alive_connection_is_reused(external_anki):
+    connection = http.client.HTTPConnection("localhost", external_anki.port)
+    request_data = json.dumps(Client.make_request("version"))
+
+    for _ in range(3):
+        connection.request("POST", "/", request_data)
+        response = connection.getresponse()
+        assert response.getheader("Connection") == "keep-alive"
+        assert json.loads(response.read()) == {"error": None, "result": 6}
+
+    connection.close()
+
+
+def make_raw_request(action, connection):
+    body = json.dumps(Client.make_request(action)).encode("utf-8")
+    return (f"POST / HTTP/1.1\r\nConnection: {connection}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode("utf-8") + body
+
+
+def test_pipelined_requests_are_answered_in_order(external_anki):
+    with socket.create_connection(("localhost", external_anki.port)) as sock:
+        sock.sendall(make_raw_request("version", "keep-alive") +
+                     make_raw_request("apiReflect", "close"))
+
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+
+    first, second = response.split(b"HTTP/1.1 200 OK")[1:]
+    assert b"Connection: keep-alive" in first
+    assert first.endswith(b'{"result": 6, "error": null}')
+    assert b"Connection: close" in second
+    assert b"scopes has invalid value" in second
+
+
+def test_partially_sent_request_does_not_block_other_clients(external_anki):
+    with socket.create_connection(("localhost", external_anki.port)) as sock:
+        sock.sendall(b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n{")
+
+        start = time.time()
+        assert external_anki.send_request("version") == {"error": None, "result": 6}
+        assert time.time() - start < 1
+
+
+def test_many_parallel_connections_are_all_served(external_anki):
+    request_data = json.dumps(Client.make_request("version"))
+    connections = [http.client.HTTPConnection("localhost", external_anki.port)
+                   for _ in range(20)]
+
+    for connection in connections:
+        connection.request("POST", "/", request_data)
+
+    for connection in connections:
+        assert json.loads(connection.getresponse().read()) == {"error": None, "result": 6}
+        connection.close()
+
+
+def test_request_with_too_large_body_is_rejected(external_anki):
+    with socket.create_connection(("localhost", external_anki.port)) as sock:
+        sock.sendall(b"POST / HTTP/1.1\r\nContent-Length: 99999999999999\r\n\r\n")
+
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+
+    assert response.startswith(b"HTTP/1.1 413 Payload Too Large")
+    assert external_anki.send_request("version") == {"error": None, "result": 6}
+
+
+def test_request_is_answered_after_client_shuts_down_sending(external_anki):
+    with socket.create_connection(("localhost", external_anki.port)) as sock:
+        sock.sendall(make_raw_request("version", "close"))
+        sock.shutdown(socket.SHUT_WR)
+
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b'{"result": 6, "error": null}')
+
+
+def test_io_thread_answers_requests(external_anki_with_io_thread):
+    response = external_anki_with_io_thread.send_request("version")
+    assert response == {"error": None, "result": 6}
+
+
+def test_io_thread_answers_pipelined_requests_in_order(external_anki_with_io_thread):
+    # every reply is deferred until the main thread has run its action,
+    # so the second request waits on the reply to the first one
+    with socket.create_connection(("localhost", external_anki_with_io_thread.port)) as sock:
+        sock.sendall(make_raw_request("deckNames", "keep-alive") +
+                     make_raw_request("version", "close"))
+
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+
+    first, second = response.split(b"HTTP/1.1 200 OK")[1:]
+    assert b"Connection: keep-alive" in first
+    assert first.endswith(b'{"result": ["Default"], "error": null}')
+    assert b"Connection: close" in second
+    assert second.endswith(b'{"result": 6, "error": null}')
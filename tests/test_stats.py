@@ -1,3 +1,7 @@
+import time
+
+import pytest
+
 from conftest import ac
 
 
@@ -11,6 +15,38 @@ def test_getNumCardsReviewedByDay(setup):
     assert isinstance(result, list)
 
 
+def test_review_counts_are_updated_with_new_reviews(setup):
+    now = int(time.time() * 1000)
+    ac.insertReviews(reviews=[(now, setup.card_ids[0], -1, 3, 4, -60, 2500, 6157, 0)])
+
+    # reviews of today are counted without building the counts by day
+    builds = ac.getCacheStats()["reviewCounts"]["builds"]
+    assert ac.getNumCardsReviewedToday() == 1
+    assert ac.getCacheStats()["reviewCounts"]["builds"] == builds
+
+    # a review that does not invalidate the counts is counted incrementally,
+    # as are cards answered in the reviewer
+    assert ac.getNumCardsReviewedByDay()[0][1] == 1
+    builds = ac.getCacheStats()["reviewCounts"]["builds"]
+    ac.onOperationDidExecute(None, ac.reviewer())
+    ac.collection().db.execute("insert into revlog values (?, ?, -1, 3, 4, -60, 2500, 6157, 0)",
+                               now + 1, setup.card_ids[1])
+    assert ac.getNumCardsReviewedToday() == 2
+    assert ac.getCacheStats()["reviewCounts"]["builds"] == builds
+    assert ac.getNumCardsReviewedToday(deck="test_deck") == 2
+    assert ac.getNumCardsReviewedToday(deck="Default") == 0
+
+    days = ac.getNumCardsReviewedByDay()
+    assert days[0][1] == 2
+    assert ac.getNumCardsReviewedByDay(startDate=days[0][0], endDate=days[0][0]) == days[:1]
+    assert ac.getNumCardsReviewedByDay(startDate="9999-01-01") == []
+
+    # other operations may add older reviews
+    ac.onOperationDidExecute(None, None)
+    assert ac.getNumCardsReviewedToday(deck="test_deck") == 2
+    assert ac.getCacheStats()["reviewCounts"]["builds"] == builds + 1
+
+
 def test_getCollectionStatsHTML(setup):
     result = ac.getCollectionStatsHTML()
     assert isinstance(result, str)
@@ -44,3 +80,50 @@ class TestReviews:
                         }
                     ]
                 }
+
+    def test_reviews_in_pages(self, setup):
+        ac.insertReviews(reviews=[
+            (456, setup.card_ids[0], -1, 3, 4, -60, 2500, 6157, 0),
+            (789, setup.card_ids[1], -1, 1, -60, -60, 0, 4846, 0),
+            (901, setup.card_ids[0], -1, 3, 9, 4, 2500, 3000, 1),
+        ])
+
+        first = ac.cardReviews(deck="test_deck", startID=0, limit=2)
+        assert [review[0] for review in first] == [456, 789]
+        rest = ac.cardReviews(deck="test_deck", startID=first[-1][0], limit=2)
+        assert [review[0] for review in rest] == [901]
+
+        page = ac.getReviewsOfCards(cards=setup.card_ids[:2], limit=1, startID=456)
+        assert page == {setup.card_ids[0]: [], setup.card_ids[1]: [page[setup.card_ids[1]][0]]}
+        assert page[setup.card_ids[1]][0]["id"] == 789
+
+    def test_columnar_reviews(self, setup):
+        ac.insertReviews(reviews=[
+            (456, setup.card_ids[0], -1, 3, 4, -60, 2500, 6157, 0),
+            (901, setup.card_ids[0], -1, 3, 9, 4, 2500, 3000, 1),
+        ])
+
+        result = ac.getReviewsOfCards(cards=[setup.card_ids[0]], columnar=True)
+        assert result[setup.card_ids[0]]["id"] == [456, 901]
+        assert result[setup.card_ids[0]]["ivl"] == [4, 9]
+        assert ac.cardReviews(deck="test_deck", startID=0, columnar=True)["cid"] == [setup.card_ids[0]] * 2
+
+    def test_insertReviews_validates_reviews_before_inserting(self, setup):
+        with pytest.raises(Exception, match="review 1 is not valid"):
+            ac.insertReviews(reviews=[
+                (456, setup.card_ids[0], -1, 3, 4, -60, 2500, 6157, 0),
+                (789, setup.card_ids[1], -1, 1, "-60); drop table revlog; --", -60, 0, 4846, 0),
+            ])
+        assert ac.cardReviews(deck="test_deck", startID=0) == []
+
+    def test_insertReviews_skips_existing_reviews(self, setup):
+        review = (456, setup.card_ids[0], -1, 3, 4, -60, 2500, 6157, 0)
+        assert ac.insertReviews(reviews=[review]) == 1
+        with pytest.raises(Exception, match="review id already exists"):
+            ac.insertReviews(reviews=[review])
+
+        other = (789, setup.card_ids[1], -1, 1, -60, -60, 0, 4846, 0)
+        assert ac.insertReviews(reviews=[review, other, other], skipExisting=True) == 1
+        with pytest.raises(Exception, match="review id is not unique"):
+            ac.insertReviews(reviews=[(111, *review[1:]), (111, *review[1:])])
+        assert len(ac.cardReviews(deck="test_deck", startID=0)) == 2